@@ -0,0 +1,52 @@
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query
+from ..core.database import (
+    get_async_db_connection, release_async_db_connection, get_slow_queries, clear_slow_queries,
+    notify, CURRICULUM_CHANNEL
+)
+from ..core.config import SLOW_QUERY_THRESHOLD_MS, SLOW_QUERY_EXPLAIN_SAMPLE_RATE, INVALIDATION_BUS_ENABLED
+from ..core.curriculum import invalidate_curriculum, load_curriculum
+from ..core.log_buffer import get_log_buffer
+
+router = APIRouter()
+
+@router.post("/admin/curriculum/reload")
+async def reload_curriculum():
+    conn = await get_async_db_connection()
+    try:
+        invalidate_curriculum()
+        curriculum = await load_curriculum(conn)
+        if INVALIDATION_BUS_ENABLED:
+            await notify(conn, CURRICULUM_CHANNEL)
+            await conn.commit()
+        return {
+            "status": "success",
+            "version": curriculum.version,
+            "concepts": len(curriculum.concepts)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await release_async_db_connection(conn)
+
+@router.get("/admin/log-buffer")
+async def log_buffer_stats():
+    buffer = get_log_buffer()
+    if buffer is None:
+        return {"enabled": False}
+    return {"enabled": True, **buffer.stats()}
+
+@router.get("/admin/slow-queries")
+async def slow_queries(limit: int = Query(50, ge=1, le=1000), fingerprint: Optional[str] = None):
+    entries = get_slow_queries(limit, fingerprint)
+    return {
+        "threshold_ms": SLOW_QUERY_THRESHOLD_MS,
+        "explain_sample_rate": SLOW_QUERY_EXPLAIN_SAMPLE_RATE,
+        "count": len(entries),
+        "queries": entries
+    }
+
+@router.delete("/admin/slow-queries")
+async def reset_slow_queries():
+    clear_slow_queries()
+    return {"status": "success"}
@@ -13,7 +13,7 @@ DEMO_USERS = {
 }
 
 @router.post("/login", response_model=LoginResponse)
-def login_endpoint(payload: LoginRequest):
+async def login_endpoint(payload: LoginRequest):
     user_data = DEMO_USERS.get(payload.email)
     
     if user_data and payload.password: # Any password works for demo
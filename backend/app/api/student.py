@@ -1,59 +1,218 @@
-from fastapi import APIRouter, HTTPException
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query, Header, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from uuid import UUID
-from psycopg2.extras import RealDictCursor
-from ..core.database import get_db_connection, release_db_connection
-from ..core.engine_logic import get_student_progress_logic
-from ..models.student import ProgressResponse
+from ..core.database import get_async_db_connection, release_async_db_connection, fetch_all, fetch_one, stream_all
+from ..core.engine_logic import get_student_progress_logic, get_class_overview_logic
+from ..core.curriculum import get_curriculum, current_curriculum_version
+from ..core.serialization import dumps, FastJSONResponse
+from ..core.progress_cache import (
+    fetch_student_version, progress_version, progress_etag, etag_matches,
+    get_progress_entry, store_progress, progress_delta, project_fields
+)
+from ..models.student import ProgressResponse, ClassOverviewResponse
 
 router = APIRouter()
 
 @router.get("/students")
-def get_students():
-    conn = get_db_connection()
+async def get_students():
+    conn = await get_async_db_connection()
     try:
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT id, full_name, role FROM profiles WHERE role = 'student'")
-        rows = cur.fetchall()
+        rows = await fetch_all(conn, "SELECT id, full_name, role FROM profiles WHERE role = 'student'")
         return rows
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        release_db_connection(conn)
+        await release_async_db_connection(conn)
+
+# Rows after the (after, after_id) cursor; without after_id every row at
+# exactly `after` is skipped. The plain range on created_at lets the planner
+# prune older partitions of learning_logs.
+AFTER_FILTER = """
+      AND l.created_at >= coalesce(%(after)s::timestamptz, '-infinity')
+      AND (l.created_at, l.id) > (coalesce(%(after)s::timestamptz, '-infinity'),
+                                  coalesce(%(after_id)s::bigint, 9223372036854775807))"""
+
+ANALYTICS_LOGS_SQL = """
+    SELECT 
+        l.id,
+        l.created_at as timestamp, 
+        l.elo_change, 
+        l.old_elo,
+        l.new_elo,
+        l.is_correct,
+        l.concept_id,
+        q.difficulty_elo
+    FROM learning_logs l
+    LEFT JOIN questions q ON l.question_id = q.id
+    WHERE l.user_id = %(student_id)s""" + AFTER_FILTER + """
+    ORDER BY l.created_at ASC, l.id ASC
+"""
+
+# At most max_points rows: the history is cut into equal-count buckets,
+# each reported as first old_elo, last new_elo and min/max new_elo.
+ANALYTICS_DOWNSAMPLED_SQL = """
+    WITH l AS (
+        SELECT 
+            l.created_at, l.elo_change, l.old_elo, l.new_elo, l.is_correct, l.concept_id,
+            q.difficulty_elo,
+            row_number() OVER (ORDER BY l.created_at, l.id) AS step,
+            ntile(%(max_points)s) OVER (ORDER BY l.created_at, l.id) AS bucket
+        FROM learning_logs l
+        LEFT JOIN questions q ON l.question_id = q.id
+        WHERE l.user_id = %(student_id)s""" + AFTER_FILTER + """
+    )
+    SELECT 
+        max(created_at) as timestamp,
+        max(step) as step,
+        count(*) as count,
+        sum(elo_change) as elo_change,
+        (array_agg(old_elo ORDER BY step))[1] as old_elo,
+        (array_agg(new_elo ORDER BY step DESC))[1] as new_elo,
+        min(new_elo) as min_elo,
+        max(new_elo) as max_elo,
+        avg(is_correct::int)::float8 as accuracy,
+        avg(is_correct::int) >= 0.5 as is_correct,
+        (array_agg(concept_id ORDER BY step DESC))[1] as concept_id,
+        round(avg(difficulty_elo))::int as difficulty_elo
+    FROM l
+    GROUP BY bucket
+    ORDER BY bucket
+"""
+
+ANALYTICS_SUMMARY_SQL = """
+    SELECT count(*) as total_steps, count(DISTINCT concept_id) as unique_concepts
+    FROM learning_logs l
+    WHERE l.user_id = %(student_id)s""" + AFTER_FILTER + """
+"""
+
+async def _stream_ndjson(conn, query, params):
+    async for row in stream_all(conn, query, params):
+        yield dumps(row) + b"\n"
+
+async def _finish_stream(stream, conn):
+    # Runs after the response, also when the client disconnected before or
+    # during the body; the stream is closed before its connection is returned
+    try:
+        await stream.aclose()
+    finally:
+        await release_async_db_connection(conn)
+
+@router.get("/class-overview", response_model=ClassOverviewResponse)
+async def get_class_overview(
+    role: str = "student",
+    recent: int = Query(20, ge=1, le=200)
+):
+    conn = await get_async_db_connection()
+    try:
+        data = await get_class_overview_logic(role, recent, conn)
+        return ClassOverviewResponse(**data)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await release_async_db_connection(conn)
 
 @router.get("/analytics/{student_id}")
-def get_student_analytics(student_id: UUID):
-    conn = get_db_connection()
+async def get_student_analytics(
+    student_id: UUID,
+    after: Optional[datetime] = None,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=10000),
+    max_points: Optional[int] = Query(None, ge=1, le=10000),
+    format: str = Query("json", pattern="^(json|ndjson)$")
+):
+    if format == "ndjson" and max_points:
+        raise HTTPException(status_code=400, detail="max_points is not supported with format=ndjson")
+    params = {"student_id": str(student_id), "after": after, "after_id": after_id}
+    conn = await get_async_db_connection()
     try:
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        query = """
-            SELECT 
-                l.created_at as timestamp, 
-                l.elo_change, 
-                l.old_elo,
-                l.new_elo,
-                l.is_correct,
-                l.concept_id,
-                q.difficulty_elo
-            FROM learning_logs l
-            LEFT JOIN questions q ON l.question_id = q.id
-            WHERE l.user_id = %s
-            ORDER BY l.created_at ASC
-        """
-        cur.execute(query, (str(student_id),))
-        logs = cur.fetchall()
-        return {"logs": logs}
+        if format == "ndjson":
+            query = ANALYTICS_LOGS_SQL
+            if limit:
+                query += " LIMIT %(limit)s"
+                params["limit"] = limit
+            stream = _stream_ndjson(conn, query, params)
+            response = StreamingResponse(stream, media_type="application/x-ndjson",
+                                         background=BackgroundTask(_finish_stream, stream, conn))
+            conn = None
+            return response
+
+        if max_points:
+            params["max_points"] = max_points
+            logs = await fetch_all(conn, ANALYTICS_DOWNSAMPLED_SQL, params)
+            summary = await fetch_one(conn, ANALYTICS_SUMMARY_SQL, params)
+            return FastJSONResponse({"logs": logs, "summary": summary})
+
+        if limit:
+            # Keyset pagination on (created_at, id): pass next_cursor's fields back as query params
+            logs = await fetch_all(conn, ANALYTICS_LOGS_SQL + " LIMIT %(limit)s", {**params, "limit": limit})
+            next_cursor = None
+            if len(logs) == limit:
+                next_cursor = {"after": logs[-1]['timestamp'], "after_id": logs[-1]['id']}
+            return FastJSONResponse({"logs": logs, "next_cursor": next_cursor})
+
+        logs = await fetch_all(conn, ANALYTICS_LOGS_SQL, params)
+        return FastJSONResponse({"logs": logs})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        release_db_connection(conn)
+        if conn is not None:
+            await release_async_db_connection(conn)
+
+# "version" is accepted too, although it is always returned
+PROGRESS_FIELDS = set(ProgressResponse.model_fields)
 
 @router.get("/student-progress/{student_id}", response_model=ProgressResponse)
-def get_student_progress(student_id: UUID):
-    conn = get_db_connection()
+async def get_student_progress(
+    student_id: UUID,
+    since_version: Optional[str] = None,
+    fields: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None)
+):
+    student_id = str(student_id)
+    projection = None
+    if fields:
+        projection = {f.strip() for f in fields.split(",") if f.strip()}
+        unknown = projection - PROGRESS_FIELDS
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+
+    conn = await get_async_db_connection()
     try:
-        data = get_student_progress_logic(str(student_id), conn)
-        return ProgressResponse(**data)
+        # Read before the payload, so a payload is never older than its tag
+        student_version = await fetch_student_version(student_id, conn)
+
+        entry = None
+        curriculum_version = current_curriculum_version()
+        if curriculum_version is not None:
+            version = progress_version(curriculum_version, student_version)
+            headers = {"ETag": progress_etag(version), "Cache-Control": "no-cache"}
+            if etag_matches(if_none_match, headers["ETag"]):
+                return Response(status_code=304, headers=headers)
+            entry = get_progress_entry(student_id, version)
+
+        if entry is None:
+            curriculum = await get_curriculum(conn)
+            # Built by the engine with exactly the ProgressResponse fields, so it
+            # is serialized directly instead of being validated again
+            data = await get_student_progress_logic(student_id, conn, student_version)
+            version = progress_version(curriculum.version, student_version)
+            entry = store_progress(student_id, version, curriculum.version, data)
+            headers = {"ETag": progress_etag(version), "Cache-Control": "no-cache"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        release_db_connection(conn)
+        await release_async_db_connection(conn)
+
+    if since_version is None and projection is None:
+        return FastJSONResponse(entry.body, headers=headers)
+
+    # Delta against the snapshot the client last saw; full snapshot when it is gone
+    payload = progress_delta(entry, since_version) if since_version else None
+    if payload is None:
+        payload = {"mode": "full", **entry.payload}
+    if projection is not None:
+        payload = project_fields(payload, projection)
+    return FastJSONResponse(payload, headers=headers)
@@ -6,4 +6,41 @@ load_dotenv()
 MASTERY_THRESHOLD = 1250
 BASE_K = 24
 STRATEGY = "lowest_elo"
+# ELO of concepts a student has not answered yet; student_mastery only
+# holds rows for concepts with at least one answer
+DEFAULT_ELO = int(os.environ.get("DEFAULT_ELO", 1000))
 DB_URL = os.environ.get("DB_URL")
+DB_POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN_SIZE", 2))
+DB_POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", 20))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+
+# Hot student state (ELO vector, mastery flags, attempts, frontier) for active students
+STUDENT_STATE_CACHE_SIZE = int(os.environ.get("STUDENT_STATE_CACHE_SIZE", 10000))
+STUDENT_STATE_IDLE_SECONDS = float(os.environ.get("STUDENT_STATE_IDLE_SECONDS", 1800))
+
+# Time zone of the daily activity counters ("today"); defaults to the database's TimeZone setting
+ACTIVITY_TIMEZONE = os.environ.get("ACTIVITY_TIMEZONE")
+
+PROGRESS_CACHE_SIZE = int(os.environ.get("PROGRESS_CACHE_SIZE", 5000))
+PROGRESS_HISTORY_SIZE = int(os.environ.get("PROGRESS_HISTORY_SIZE", 4))
+
+# Write-behind learning_logs ingestion (off by default)
+LOG_WRITE_BEHIND = os.environ.get("LOG_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+LOG_BUFFER_SIZE = int(os.environ.get("LOG_BUFFER_SIZE", 10000))
+LOG_FLUSH_BATCH_SIZE = int(os.environ.get("LOG_FLUSH_BATCH_SIZE", 500))
+LOG_FLUSH_INTERVAL = float(os.environ.get("LOG_FLUSH_INTERVAL", 1.0))
+LOG_ENQUEUE_TIMEOUT = float(os.environ.get("LOG_ENQUEUE_TIMEOUT", 0.5))
+# Consecutive failed COPYs of one batch before its rows are dropped
+LOG_FLUSH_MAX_RETRIES = int(os.environ.get("LOG_FLUSH_MAX_RETRIES", 5))
+
+# Route/query latency metrics served at /metrics
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Slow-query capture; sampled plans use EXPLAIN (ANALYZE, BUFFERS) only for side-effect-free SELECTs, plain EXPLAIN otherwise
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get("SLOW_QUERY_THRESHOLD_MS", 200))
+SLOW_QUERY_LOG_SIZE = int(os.environ.get("SLOW_QUERY_LOG_SIZE", 200))
+SLOW_QUERY_EXPLAIN_SAMPLE_RATE = float(os.environ.get("SLOW_QUERY_EXPLAIN_SAMPLE_RATE", 0.0))
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.environ.get("SLOW_QUERY_EXPLAIN_INTERVAL", 60))
+
+# Cross-process cache invalidation over LISTEN/NOTIFY; enable when running several workers
+INVALIDATION_BUS_ENABLED = os.environ.get("INVALIDATION_BUS_ENABLED", "false").lower() in ("1", "true", "yes")
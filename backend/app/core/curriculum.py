@@ -0,0 +1,140 @@
+import asyncio
+import hashlib
+from bisect import bisect_left, bisect_right
+from .database import fetch_all
+from .serialization import dumps
+
+# Process-wide curriculum cache (concepts joined to chapters, questions).
+# Curriculum edits are rare, so it is loaded once and only reloaded
+# after an explicit invalidate_curriculum(). Its version is a hash of the
+# content, so every process serving the same data reports the same version.
+_curriculum = None
+# Bumped by every invalidation; a load that overlaps one is discarded
+_generation = 0
+_load_lock = asyncio.Lock()
+
+
+def build_question_payload(q):
+    safe_options = []
+    raw_options = q['options']
+    if isinstance(raw_options, list):
+        for opt in raw_options:
+            safe_options.append({"text": opt.get("text", "") if isinstance(opt, dict) else str(opt)})
+    else:
+        safe_options = [{"text": "Options format error"}]
+
+    return {
+        "question_id": q['id'],
+        "concept_id": q['concept_id'],
+        "content_text": q['content_text'],
+        "options": safe_options,
+        "difficulty_elo": q['difficulty_elo']
+    }
+
+
+class QuestionIndex:
+    # Questions of one concept sorted by difficulty_elo, with the
+    # response payload pre-built for each question.
+    def __init__(self, questions):
+        questions = sorted(questions, key=lambda q: q['difficulty_elo'])
+        self.difficulties = [q['difficulty_elo'] for q in questions]
+        self.questions = [build_question_payload(q) for q in questions]
+
+    def __len__(self):
+        return len(self.questions)
+
+    def nearest(self, elo):
+        """Return every question whose difficulty is closest to elo."""
+        d = self.difficulties
+        if not d:
+            return []
+        i = bisect_left(d, elo)
+        min_diff = float('inf')
+        if i > 0:
+            min_diff = elo - d[i - 1]
+        if i < len(d):
+            min_diff = min(min_diff, d[i] - elo)
+        lo = bisect_left(d, elo - min_diff)
+        hi = bisect_right(d, elo + min_diff)
+        return self.questions[lo:hi]
+
+
+class Curriculum:
+    def __init__(self, version, concepts, questions_by_concept):
+        self.version = version
+        # Ordered by chapter order_index, concept id
+        self.concepts = concepts
+        self.concept_by_id = {c['concept_id']: c for c in concepts}
+        # Concept ordinal, the index into per-student state arrays
+        self.concept_index = {c['concept_id']: i for i, c in enumerate(concepts)}
+        self.successors = {}
+        for c in concepts:
+            for p_id in c['prerequisites']:
+                self.successors.setdefault(p_id, []).append(c['concept_id'])
+        self.questions_by_concept = questions_by_concept
+
+
+async def _fetch_curriculum(conn):
+    concepts = await fetch_all(conn, """
+        SELECT
+            c.id as concept_id,
+            c.name as concept_name,
+            c.chapter_id,
+            c.prerequisites,
+            ch.name as chapter_name,
+            ch.order_index as chapter_order
+        FROM concepts c
+        LEFT JOIN chapters ch ON c.chapter_id = ch.id
+        ORDER BY ch.order_index, c.id
+    """)
+    for c in concepts:
+        c['prerequisites'] = c['prerequisites'] or []
+
+    questions = await fetch_all(conn, "SELECT id, concept_id, content_text, options, difficulty_elo FROM questions")
+    questions.sort(key=lambda q: q['id'])
+
+    version = hashlib.sha1(dumps(concepts) + dumps(questions)).hexdigest()[:12]
+    grouped = {}
+    for q in questions:
+        grouped.setdefault(q['concept_id'], []).append(q)
+    questions_by_concept = {cid: QuestionIndex(qs) for cid, qs in grouped.items()}
+    return version, concepts, questions_by_concept
+
+
+async def load_curriculum(conn):
+    global _curriculum
+    while True:
+        generation = _generation
+        version, concepts, questions_by_concept = await _fetch_curriculum(conn)
+        # An invalidation during the queries may not be reflected in the rows
+        if generation == _generation:
+            break
+
+    _curriculum = Curriculum(version, concepts, questions_by_concept)
+    return _curriculum
+
+
+async def get_curriculum(conn):
+    if _curriculum is None:
+        # Only one request reloads; the others wait for its result
+        async with _load_lock:
+            if _curriculum is None:
+                await load_curriculum(conn)
+    return _curriculum
+
+
+def current_curriculum_version():
+    # Version of the loaded curriculum, or None when a reload is pending
+    return _curriculum.version if _curriculum is not None else None
+
+
+def invalidate_curriculum():
+    global _curriculum, _generation
+    _generation += 1
+    _curriculum = None
+
+
+def on_curriculum_changed(data):
+    # Another process (or the curriculum loader) changed concepts or
+    # questions; reload lazily on the next request
+    invalidate_curriculum()
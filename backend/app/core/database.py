@@ -1,10 +1,31 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
 import psycopg2
 from psycopg2 import pool
-from .config import DB_URL
+from psycopg import AsyncConnection
+from psycopg.pq import TransactionStatus
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+from .config import (
+    DB_URL, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT, ACTIVITY_TIMEZONE,
+    SLOW_QUERY_THRESHOLD_MS, SLOW_QUERY_LOG_SIZE, SLOW_QUERY_EXPLAIN_SAMPLE_RATE, SLOW_QUERY_EXPLAIN_INTERVAL
+)
+from . import metrics
 
-# Global connection pool
+logger = logging.getLogger(__name__)
+
+# Sync connection pool (psycopg2), kept for scripts
 _pool = None
 
+# Async connection pool (psycopg 3), used by the API routers
+_async_pool = None
+
 def init_db_pool():
     global _pool
     if _pool is None:
@@ -24,3 +45,304 @@ def release_db_connection(conn):
     global _pool
     if _pool is not None and conn is not None:
         _pool.putconn(conn)
+
+# Day boundary of the daily activity counters. Pooled connections run in
+# this time zone, so CURRENT_DATE in SQL and activity_date() agree.
+_activity_tz = ZoneInfo("UTC")
+
+async def _resolve_activity_timezone():
+    global _activity_tz
+    name = ACTIVITY_TIMEZONE
+    if not name:
+        async with await AsyncConnection.connect(DB_URL) as conn:
+            name = (await (await conn.execute("SHOW TimeZone")).fetchone())[0]
+    try:
+        _activity_tz = ZoneInfo(name)
+    except Exception:
+        logger.warning("Time zone %r is not an IANA zone; activity days use UTC", name)
+        _activity_tz = ZoneInfo("UTC")
+
+async def _configure_connection(conn):
+    await conn.execute("SELECT set_config('TimeZone', %s, false)", (_activity_tz.key,))
+    await conn.commit()
+
+def activity_date():
+    return datetime.now(_activity_tz).date()
+
+async def init_async_db_pool():
+    global _async_pool
+    if _async_pool is None:
+        await _resolve_activity_timezone()
+        _async_pool = AsyncConnectionPool(
+            conninfo=DB_URL,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            timeout=DB_POOL_TIMEOUT,
+            configure=_configure_connection,
+            open=False
+        )
+        await _async_pool.open()
+
+async def close_async_db_pool():
+    global _async_pool
+    if _async_pool is not None:
+        await _async_pool.close()
+        _async_pool = None
+
+async def get_async_db_connection():
+    if _async_pool is None:
+        await init_async_db_pool()
+    start = time.perf_counter()
+    try:
+        conn = await _async_pool.getconn()
+    except PoolTimeout:
+        metrics.db_pool_timeouts.inc()
+        raise
+    finally:
+        metrics.db_pool_wait.observe(time.perf_counter() - start)
+    metrics.db_pool_in_use.inc()
+    return conn
+
+async def release_async_db_connection(conn):
+    if _async_pool is not None and conn is not None:
+        try:
+            # Read-only and failed handlers never commit; end their transaction here.
+            # A connection still running a cancelled query is left to putconn,
+            # which discards it.
+            if conn.info.transaction_status in (TransactionStatus.INTRANS, TransactionStatus.INERROR):
+                await conn.rollback()
+        except Exception:
+            # A broken connection; putconn discards it and the pool replaces it
+            logger.warning("Rollback failed on release", exc_info=True)
+        finally:
+            await _async_pool.putconn(conn)
+            metrics.db_pool_in_use.dec()
+
+# Query helpers used by the routers; each call is timed per query
+# fingerprint along with the number of rows it returned or affected.
+async def fetch_all(conn, query, params=None):
+    start = time.perf_counter()
+    try:
+        async with conn.cursor(row_factory=dict_row) as cur:
+            await cur.execute(query, params)
+            rows = await cur.fetchall()
+    except Exception:
+        metrics.db_query_errors.inc(1, metrics.query_fingerprint(query))
+        raise
+    await _observe(conn, query, params, time.perf_counter() - start, len(rows))
+    return rows
+
+async def fetch_one(conn, query, params=None):
+    start = time.perf_counter()
+    try:
+        async with conn.cursor(row_factory=dict_row) as cur:
+            await cur.execute(query, params)
+            row = await cur.fetchone()
+    except Exception:
+        metrics.db_query_errors.inc(1, metrics.query_fingerprint(query))
+        raise
+    await _observe(conn, query, params, time.perf_counter() - start, 0 if row is None else 1)
+    return row
+
+async def execute(conn, query, params=None):
+    start = time.perf_counter()
+    try:
+        async with conn.cursor() as cur:
+            await cur.execute(query, params)
+            rowcount = cur.rowcount
+    except Exception:
+        metrics.db_query_errors.inc(1, metrics.query_fingerprint(query))
+        raise
+    await _observe(conn, query, params, time.perf_counter() - start, max(rowcount, 0))
+    return rowcount
+
+async def stream_all(conn, query, params=None, batch_size=1000):
+    # Server-side cursor, rows are yielded without materializing the result.
+    # Only time spent in the database counts, not the consumer's time
+    # between batches.
+    elapsed, rows = 0.0, 0
+    try:
+        async with conn.cursor(name="stream_all", row_factory=dict_row) as cur:
+            start = time.perf_counter()
+            await cur.execute(query, params)
+            elapsed += time.perf_counter() - start
+            while True:
+                start = time.perf_counter()
+                batch = await cur.fetchmany(batch_size)
+                elapsed += time.perf_counter() - start
+                if not batch:
+                    break
+                rows += len(batch)
+                for row in batch:
+                    yield row
+    except GeneratorExit:
+        # Closed early by the consumer; timed, but no plan is captured
+        metrics.observe_query(query, elapsed, rows)
+        raise
+    except Exception:
+        metrics.db_query_errors.inc(1, metrics.query_fingerprint(query))
+        raise
+    await _observe(conn, query, params, elapsed, rows)
+
+async def _observe(conn, query, params, elapsed, rows):
+    metrics.observe_query(query, elapsed, rows)
+    if elapsed * 1000 >= SLOW_QUERY_THRESHOLD_MS:
+        await _capture_slow_query(conn, query, params, elapsed, rows)
+
+# Slow-query capture: the newest SLOW_QUERY_LOG_SIZE slow statements with
+# their parameter shape and, when sampled, their plan: EXPLAIN (ANALYZE,
+# BUFFERS) for side-effect-free reads, plain EXPLAIN otherwise. Served by
+# /admin/slow-queries.
+_slow_queries = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+_last_explained = {}
+
+def params_shape(params):
+    # Types (and list lengths) only, never the values themselves
+    def shape(v):
+        if isinstance(v, (list, tuple)):
+            return f"{type(v).__name__}[{len(v)}]"
+        return type(v).__name__
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {k: shape(v) for k, v in params.items()}
+    return [shape(v) for v in params]
+
+# Calls with side effects that a replayed SELECT would repeat
+_SIDE_EFFECT_CALLS = ("PG_NOTIFY", "NEXTVAL", "SETVAL", "PG_ADVISORY", "SET_CONFIG", "PG_SLEEP",
+                      "PG_CANCEL_BACKEND", "PG_TERMINATE_BACKEND", "DBLINK", "LO_")
+
+def _analyzable(statement):
+    # EXPLAIN ANALYZE executes the statement, so only side-effect-free reads
+    # are replayed; everything else gets a plain EXPLAIN
+    upper = statement.upper()
+    if not upper.startswith(("SELECT", "WITH")):
+        return False
+    if any(word in upper for word in ("FOR UPDATE", "FOR SHARE", "FOR NO KEY UPDATE", "FOR KEY SHARE",
+                                      "INSERT ", "UPDATE ", "DELETE ", "MERGE ")):
+        return False
+    return not any(call in upper for call in _SIDE_EFFECT_CALLS)
+
+async def _explain(conn, query, params, analyze):
+    if conn.info.transaction_status not in (TransactionStatus.IDLE, TransactionStatus.INTRANS):
+        return None
+    try:
+        # A savepoint keeps a failing EXPLAIN from aborting the caller's transaction
+        async with conn.transaction():
+            async with conn.cursor() as cur:
+                options = "ANALYZE, BUFFERS, FORMAT JSON" if analyze else "FORMAT JSON"
+                await cur.execute(f"EXPLAIN ({options}) " + query, params)
+                row = await cur.fetchone()
+        return row[0] if row else None
+    except Exception as e:
+        logger.warning("EXPLAIN of slow query failed: %s", e)
+        return None
+
+async def _capture_slow_query(conn, query, params, elapsed, rows):
+    fp = metrics.query_fingerprint(query)
+    statement = metrics.normalize_query(query)
+    metrics.db_slow_queries.inc(1, fp)
+
+    plan = None
+    analyzed = False
+    now = time.monotonic()
+    if (SLOW_QUERY_EXPLAIN_SAMPLE_RATE > 0
+            and random.random() < SLOW_QUERY_EXPLAIN_SAMPLE_RATE
+            and now - _last_explained.get(fp, float("-inf")) >= SLOW_QUERY_EXPLAIN_INTERVAL):
+        _last_explained[fp] = now
+        analyzed = _analyzable(statement)
+        plan = await _explain(conn, query, params, analyzed)
+
+    _slow_queries.append({
+        "captured_at": datetime.now(timezone.utc).isoformat(),
+        "fingerprint": fp,
+        "statement": statement[:1000],
+        "duration_ms": round(elapsed * 1000, 2),
+        "rows": rows,
+        "params_shape": params_shape(params),
+        "plan": plan,
+        "plan_analyzed": analyzed and plan is not None,
+    })
+
+def get_slow_queries(limit=None, fingerprint=None):
+    entries = [e for e in reversed(_slow_queries) if fingerprint is None or e["fingerprint"] == fingerprint]
+    return entries[:limit] if limit else entries
+
+def clear_slow_queries():
+    _slow_queries.clear()
+    _last_explained.clear()
+
+# Cross-process invalidation bus on LISTEN/NOTIFY. Payloads are
+# "<process token>:<data>"; a process skips its own messages. NOTIFY is
+# transactional, so a rolled-back write never invalidates anyone.
+CURRICULUM_CHANNEL = "adaptive_curriculum"
+STUDENT_CHANNEL = "adaptive_student"
+PROCESS_TOKEN = os.urandom(8).hex()
+
+_listener_task = None
+
+def notify_payload(data=""):
+    return f"{PROCESS_TOKEN}:{data}"
+
+async def notify(conn, channel, data=""):
+    # Delivered when the caller's transaction commits
+    await execute(conn, "SELECT pg_notify(%s, %s)", (channel, notify_payload(data)))
+
+async def _listen(handlers, ready):
+    delay = 1
+    connected_before = False
+    while True:
+        try:
+            conn = await AsyncConnection.connect(DB_URL, autocommit=True)
+            async with conn:
+                for channel in handlers:
+                    await conn.execute(f"LISTEN {channel}")
+                if connected_before:
+                    # Messages may have been missed while disconnected
+                    for handler in handlers.values():
+                        handler(None)
+                connected_before = True
+                delay = 1
+                ready.set()
+                async for message in conn.notifies():
+                    token, _, data = message.payload.partition(":")
+                    if token == PROCESS_TOKEN:
+                        continue
+                    metrics.invalidation_messages.inc(1, message.channel)
+                    handler = handlers.get(message.channel)
+                    if handler is not None:
+                        handler(data)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Invalidation listener lost its connection, retrying in %ss", delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+async def start_notification_listener(handlers):
+    """Listen on a dedicated connection; handlers maps channel to a callable
+    taking the message data, or None after a reconnect (evict everything)."""
+    global _listener_task
+    if _listener_task is None:
+        ready = asyncio.Event()
+        _listener_task = asyncio.create_task(_listen(handlers, ready))
+        await asyncio.wait_for(ready.wait(), timeout=DB_POOL_TIMEOUT)
+
+async def stop_notification_listener():
+    global _listener_task
+    if _listener_task is not None:
+        _listener_task.cancel()
+        try:
+            await _listener_task
+        except asyncio.CancelledError:
+            pass
+        _listener_task = None
+
+def _pool_stats():
+    if _async_pool is None:
+        return {}
+    stats = _async_pool.get_stats()
+    return {(key,): stats.get(key, 0) for key in ("pool_min", "pool_max", "pool_size", "pool_available", "requests_waiting")}
+
+metrics.register(metrics.Gauge(
+    "adaptive_db_pool", "Async pool state as reported by psycopg_pool.", labels=("stat",), callback=_pool_stats))
@@ -1,36 +1,233 @@
 import random
-from psycopg2.extras import RealDictCursor
-from .config import MASTERY_THRESHOLD
+import logging
+from .database import fetch_all, fetch_one, STUDENT_CHANNEL, notify_payload
+from .config import MASTERY_THRESHOLD, BASE_K, DEFAULT_ELO, LOG_WRITE_BEHIND, INVALIDATION_BUS_ENABLED
+from .curriculum import get_curriculum
+from .student_state import get_student_state, apply_answer
+from .log_buffer import get_log_buffer
+from .progress_cache import shared_student_version
+from . import metrics
 
-def get_student_progress_logic(student_id: str, conn):
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+logger = logging.getLogger(__name__)
+
+async def select_next_question_logic(student_id: str, conn):
+    curriculum = await get_curriculum(conn)
+    if not curriculum.concepts:
+        return {"status": "error", "message": "No concepts found (did you load the curriculum?)"}
+
+    state = await get_student_state(student_id, curriculum, conn)
+    frontier = state.frontier
+
+    if len(frontier.mastered) == len(curriculum.concepts):
+        return {"status": "all_mastered"}
+
+    index = curriculum.concept_index
+    candidate_ids = frontier.ready if frontier.ready else frontier.locked
+    candidates = [{"concept_id": cid, "current_elo": state.elo[index[cid]]} for cid in candidate_ids]
+
+    if not candidates:
+        return {"status": "error", "message": "No candidates found"}
+
+    # Questions come from the curriculum cache, indexed by concept_id
+    questions_by_concept = curriculum.questions_by_concept
+
+    candidates_by_elo = {}
+    for c in candidates:
+        elo = c['current_elo']
+        candidates_by_elo.setdefault(elo, []).append(c)
+    
+    sorted_elos = sorted(candidates_by_elo.keys())
+    target_concept = None
+    questions = None
+    
+    for elo in sorted_elos:
+        group = candidates_by_elo[elo]
+        random.shuffle(group)
+        for concept_cand in group:
+            qs = questions_by_concept.get(concept_cand['concept_id'])
+            if qs:
+                target_concept = concept_cand
+                questions = qs
+                break
+        if target_concept:
+            break
+    
+    if not target_concept:
+        return {"status": "error", "message": "No questions available"}
+
+    chosen_q = random.choice(questions.nearest(target_concept['current_elo']))
+    return {"status": "success", "data": chosen_q}
+
+# One statement: locks the mastery row, computes the Elo update server-side,
+# writes it, bumps the activity counters and (unless logs are written
+# behind) inserts the learning_logs row.
+# A concept without a mastery row starts from %(default_elo)s and the row
+# is inserted. Returns no row if the question does not exist and a NULL
+# old_elo if a concurrent submit inserted the row first.
+_SUBMIT_ANSWER_CTE = """
+    WITH q AS (
+        SELECT concept_id, difficulty_elo FROM questions WHERE id = %(question_id)s
+    ), locked AS (
+        SELECT sm.current_elo
+        FROM student_mastery sm
+        JOIN q ON sm.concept_id = q.concept_id
+        WHERE sm.user_id = %(student_id)s
+        FOR UPDATE OF sm
+    ), old AS (
+        SELECT q.concept_id, locked.current_elo IS NOT NULL AS has_row,
+               coalesce(locked.current_elo, %(default_elo)s) AS current_elo,
+               (1.0 / (1.0 + power(10.0, (q.difficulty_elo - coalesce(locked.current_elo, %(default_elo)s)) / 400.0)))::float8 AS expected_p
+        FROM q LEFT JOIN locked ON true
+    ), new AS (
+        SELECT concept_id, has_row, current_elo AS old_elo,
+               %(base_k)s * (%(score)s - expected_p) AS elo_change,
+               round(current_elo + %(base_k)s * (%(score)s - expected_p))::int AS new_elo
+        FROM old
+    ), updated AS (
+        UPDATE student_mastery sm
+        SET current_elo = new.new_elo,
+            total_attempts = sm.total_attempts + 1,
+            is_mastered = new.new_elo >= %(threshold)s,
+            updated_at = now()
+        FROM new
+        WHERE new.has_row AND sm.user_id = %(student_id)s AND sm.concept_id = new.concept_id
+        RETURNING sm.concept_id, new.old_elo, new.new_elo, new.elo_change, sm.is_mastered, sm.updated_at
+    ), inserted AS (
+        INSERT INTO student_mastery AS sm (user_id, concept_id, current_elo, is_mastered, total_attempts, updated_at)
+        SELECT %(student_id)s, concept_id, new_elo, new_elo >= %(threshold)s, 1, now()
+        FROM new
+        WHERE NOT new.has_row
+        ON CONFLICT (user_id, concept_id) DO NOTHING
+        RETURNING sm.concept_id, sm.is_mastered, sm.updated_at
+    ), upd AS (
+        SELECT * FROM updated
+        UNION ALL
+        SELECT i.concept_id, new.old_elo, new.new_elo, new.elo_change, i.is_mastered, i.updated_at
+        FROM inserted i CROSS JOIN new
+    ), totals AS (
+        INSERT INTO student_activity_counters AS t (user_id, total_answers, correct_answers, elo_growth)
+        SELECT %(student_id)s, 1, CASE WHEN %(is_correct)s THEN 1 ELSE 0 END, round(elo_change)::int FROM upd
+        ON CONFLICT (user_id) DO UPDATE
+        SET total_answers = t.total_answers + 1,
+            correct_answers = t.correct_answers + EXCLUDED.correct_answers,
+            elo_growth = t.elo_growth + EXCLUDED.elo_growth,
+            updated_at = now()
+        RETURNING t.total_answers, t.updated_at
+    ), daily AS (
+        INSERT INTO student_daily_activity AS d (user_id, activity_date, answers, correct_answers)
+        SELECT %(student_id)s, CURRENT_DATE, 1, CASE WHEN %(is_correct)s THEN 1 ELSE 0 END FROM upd
+        ON CONFLICT (user_id, activity_date) DO UPDATE
+        SET answers = d.answers + 1,
+            correct_answers = d.correct_answers + EXCLUDED.correct_answers
+    )"""
+
+_SUBMIT_ANSWER_LOG_CTE = """, log AS (
+        INSERT INTO learning_logs (user_id, question_id, concept_id, is_correct, old_elo, new_elo, elo_change)
+        SELECT %(student_id)s, %(question_id)s, concept_id, %(is_correct)s, old_elo, new_elo, round(elo_change)::int
+        FROM upd
+    )"""
+
+# With the invalidation bus on, the same statement tells other processes
+# to drop this student's cached state once the transaction commits
+_SUBMIT_ANSWER_NOTIFY = """,
+           pg_notify(%(notify_channel)s, %(notify_payload)s)"""
+
+_SUBMIT_ANSWER_SELECT = """
+    SELECT q.concept_id, upd.old_elo, upd.new_elo, upd.elo_change, upd.is_mastered, upd.updated_at,
+           totals.total_answers, totals.updated_at AS counters_updated_at""" + (
+    _SUBMIT_ANSWER_NOTIFY if INVALIDATION_BUS_ENABLED else "") + """
+    FROM q LEFT JOIN upd ON true LEFT JOIN totals ON true
+"""
+
+SUBMIT_ANSWER_SQL = _SUBMIT_ANSWER_CTE + _SUBMIT_ANSWER_LOG_CTE + _SUBMIT_ANSWER_SELECT
+SUBMIT_ANSWER_NO_LOG_SQL = _SUBMIT_ANSWER_CTE + _SUBMIT_ANSWER_SELECT
+
+async def submit_answer_logic(student_id: str, question_id: str, is_correct: bool, conn):
+    """Apply the Elo update for one answer. The caller commits, then calls
+    enqueue_answer_log() with the result."""
+    # Before the statement locks the mastery row, so a curriculum reload never
+    # runs with it held. A reload racing with the submit leaves the hot state
+    # on another curriculum version, and apply_answer skips it.
+    curriculum = await get_curriculum(conn)
+    sql = SUBMIT_ANSWER_NO_LOG_SQL if LOG_WRITE_BEHIND else SUBMIT_ANSWER_SQL
+    params = {
+        "student_id": student_id,
+        "question_id": question_id,
+        "is_correct": is_correct,
+        "score": 1.0 if is_correct else 0.0,
+        "base_k": BASE_K,
+        "threshold": MASTERY_THRESHOLD,
+        "default_elo": DEFAULT_ELO,
+        "notify_channel": STUDENT_CHANNEL,
+        "notify_payload": notify_payload(student_id)
+    }
+    row = await fetch_one(conn, sql, params)
+    if row and row['old_elo'] is None:
+        # Another submit created the mastery row after this statement's
+        # snapshot and nothing was written; a new statement sees and locks it
+        row = await fetch_one(conn, sql, params)
+    if not row:
+        raise LookupError("Question not found")
+    if row['old_elo'] is None:
+        raise RuntimeError("Mastery row changed concurrently")
+    
+    cid = row['concept_id']
+    is_mastered = row['is_mastered']
+    
+    # Write-through to the hot state; callers wrap the submit in
+    # student_write(), which drops it if the transaction is rolled back
+    apply_answer(student_id, curriculum, cid, row['new_elo'], is_mastered, row['updated_at'],
+                 shared_student_version({"total_answers": row['total_answers'], "updated_at": row['counters_updated_at']}))
+    result = {
+        "status": "success",
+        "old_elo": row['old_elo'],
+        "new_elo": row['new_elo'],
+        "elo_change": row['elo_change'],
+        "is_mastered": is_mastered
+    }
+    if LOG_WRITE_BEHIND:
+        result['log_row'] = (student_id, question_id, cid, is_correct, row['old_elo'],
+                             row['new_elo'], int(round(row['elo_change'])), row['updated_at'])
+    return result
+
+async def enqueue_answer_log(result):
+    """Hand a committed answer's log row to the write-behind buffer, if enabled.
+    Call it after the connection is back in the pool: waiting for room can
+    take LOG_ENQUEUE_TIMEOUT and the flusher needs a connection to make room.
+    Never raises, as the answer itself is already committed."""
+    log_row = result.pop('log_row', None)
+    if log_row is None:
+        return
+    buffer = get_log_buffer()
+    if buffer is None:
+        metrics.log_buffer_rows.inc(1, "dropped")
+        logger.error("Log write-behind buffer is not running, dropped row for %s", log_row[0])
+        return
+    await buffer.put(log_row)
+
+async def get_student_progress_logic(student_id: str, conn, student_version=None):
+    """Build the progress payload. With student_version (see
+    progress_cache.fetch_student_version), the hot state is reloaded unless
+    it reflects exactly that version."""
+    curriculum = await get_curriculum(conn)
+    state = await get_student_state(student_id, curriculum, conn, student_version)
     
     # Get all concepts with mastery
-    query = """
-        SELECT 
-            c.id as concept_id, 
-            c.name as concept_name,
-            c.chapter_id,
-            c.prerequisites,
-            ch.name as chapter_name,
-            ch.order_index as chapter_order,
-            coalesce(sm.current_elo, 1000) as current_elo, 
-            coalesce(sm.is_mastered, false) as is_mastered,
-            sm.updated_at as last_practiced
-        FROM concepts c
-        LEFT JOIN chapters ch ON c.chapter_id = ch.id
-        LEFT JOIN student_mastery sm ON c.id = sm.concept_id AND sm.user_id = %s
-        ORDER BY ch.order_index, c.id
-    """
-    cur.execute(query, (student_id,))
-    rows = cur.fetchall()
+    rows = []
+    for i, c in enumerate(curriculum.concepts):
+        rows.append({
+            **c,
+            "current_elo": state.elo[i],
+            "is_mastered": bool(state.mastered[i]),
+            "last_practiced": state.updated_at[i]
+        })
     
     total = len(rows)
     mastered = sum(1 for r in rows if r['is_mastered'])
     
     # Calculate overall stats
     total_elo = sum(r['current_elo'] for r in rows)
-    avg_elo = int(total_elo / total) if total > 0 else 1000
+    avg_elo = int(total_elo / total) if total > 0 else DEFAULT_ELO
     overall_mastery = round((mastered / total * 100), 1) if total > 0 else 0
     
     # Determine level
@@ -41,47 +238,31 @@ def get_student_progress_logic(student_id: str, conn):
     else:
         level = "Advanced"
     
-    # Get total questions answered
-    cur.execute("SELECT COUNT(*) as count FROM learning_logs WHERE user_id = %s", (student_id,))
-    total_questions = cur.fetchone()['count']
-    
-    # Get today's questions
-    cur.execute("""
-        SELECT COUNT(*) as count FROM learning_logs 
-        WHERE user_id = %s AND DATE(created_at) = CURRENT_DATE
-    """, (student_id,))
-    today_questions = cur.fetchone()['count']
+    # Get total and today's questions answered from the activity counters
+    row = await fetch_one(conn, """
+        SELECT
+            coalesce((SELECT total_answers FROM student_activity_counters
+                      WHERE user_id = %(student_id)s), 0) as total_questions,
+            coalesce((SELECT answers FROM student_daily_activity
+                      WHERE user_id = %(student_id)s AND activity_date = CURRENT_DATE), 0) as today_questions
+    """, {"student_id": student_id})
+    total_questions = row['total_questions']
+    today_questions = row['today_questions']
     
-    # Build mastery map for status calculation
-    mastery_map = {r['concept_id']: r for r in rows}
+    frontier = state.frontier
     
     # Determine concept statuses
     concept_list = []
     for r in rows:
-        c_id = r['concept_id']
-        
-        # Calculate status
-        if r['is_mastered']:
-            status = "mastered"
-        else:
-            prereqs = r['prerequisites'] or []
-            all_met = True
-            for p_id in prereqs:
-                p_data = mastery_map.get(p_id)
-                if not p_data or not p_data['is_mastered']:
-                    all_met = False
-                    break
-            status = "ready" if all_met else "locked"
-        
         concept_list.append({
             "id": r['concept_id'],
             "name": r['concept_name'],
             "chapter_id": r['chapter_id'],
             "chapter_name": r['chapter_name'],
-            "status": status,
+            "status": frontier.status(r['concept_id']),
             "current_elo": r['current_elo'],
             "is_mastered": r['is_mastered'],
-            "prerequisites": r['prerequisites'] or [],
+            "prerequisites": r['prerequisites'],
             "last_practiced": r['last_practiced'].isoformat() if r['last_practiced'] else None
         })
     
@@ -130,21 +311,17 @@ def get_student_progress_logic(student_id: str, conn):
     ][:3]  # Top 3
     
     # Recent achievements (recently mastered concepts)
-    cur.execute("""
-        SELECT c.id, c.name, sm.updated_at
-        FROM student_mastery sm
-        JOIN concepts c ON sm.concept_id = c.id
-        WHERE sm.user_id = %s AND sm.is_mastered = true
-        ORDER BY sm.updated_at DESC
-        LIMIT 3
-    """, (student_id,))
-    recent_masteries = cur.fetchall()
+    recent_masteries = sorted(
+        (r for r in rows if r['is_mastered'] and r['last_practiced']),
+        key=lambda r: r['last_practiced'],
+        reverse=True
+    )[:3]
     
     achievements = [
         {
             "type": "mastery",
-            "concept": m['name'],
-            "timestamp": m['updated_at'].isoformat()
+            "concept": m['concept_name'],
+            "timestamp": m['last_practiced'].isoformat()
         }
         for m in recent_masteries
     ]
@@ -166,3 +343,87 @@ def get_student_progress_logic(student_id: str, conn):
         "recent_achievements": achievements,
         "progress_details": rows
     }
+
+# Per-student aggregates for a whole class in one set-based pass.
+# Recent accuracy looks at each student's last %(recent)s answers.
+CLASS_OVERVIEW_SQL = """
+    WITH students AS (
+        SELECT id, full_name FROM profiles WHERE role = %(role)s
+    ), mastery AS (
+        SELECT 
+            sm.user_id,
+            count(*) as mastery_rows,
+            sum(sm.current_elo) as elo_sum,
+            count(*) FILTER (WHERE sm.is_mastered) as mastered_concepts,
+            sum(sm.total_attempts) as attempts
+        FROM student_mastery sm
+        JOIN students s ON s.id = sm.user_id
+        WHERE sm.concept_id = ANY(%(concept_ids)s)
+        GROUP BY sm.user_id
+    )
+    SELECT 
+        s.id,
+        s.full_name,
+        coalesce(m.mastery_rows, 0) as mastery_rows,
+        coalesce(m.elo_sum, 0) as elo_sum,
+        coalesce(m.mastered_concepts, 0) as mastered_concepts,
+        coalesce(m.attempts, 0) as attempts,
+        coalesce(ac.total_answers, 0) as total_answers,
+        coalesce(ac.elo_growth, 0) as elo_growth,
+        r.recent_answers,
+        r.recent_accuracy
+    FROM students s
+    LEFT JOIN mastery m ON m.user_id = s.id
+    LEFT JOIN student_activity_counters ac ON ac.user_id = s.id
+    LEFT JOIN LATERAL (
+        SELECT count(*) as recent_answers, avg(x.is_correct::int)::float8 as recent_accuracy
+        FROM (
+            SELECT is_correct FROM learning_logs
+            WHERE user_id = s.id
+            ORDER BY created_at DESC
+            LIMIT %(recent)s
+        ) x
+    ) r ON true
+    ORDER BY s.full_name, s.id
+"""
+
+async def get_class_overview_logic(role: str, recent: int, conn):
+    curriculum = await get_curriculum(conn)
+    total_concepts = len(curriculum.concepts)
+    # Mastery rows of concepts no longer in the curriculum are left out, as in the progress view
+    rows = await fetch_all(conn, CLASS_OVERVIEW_SQL, {
+        "role": role, "recent": recent, "concept_ids": list(curriculum.concept_by_id)
+    })
+
+    students = []
+    for r in rows:
+        # Concepts without a mastery row count at DEFAULT_ELO, as in the progress view
+        missing = max(total_concepts - r['mastery_rows'], 0)
+        denom = r['mastery_rows'] + missing
+        avg_elo = int((r['elo_sum'] + missing * DEFAULT_ELO) / denom) if denom > 0 else DEFAULT_ELO
+
+        flags = []
+        if r['total_answers'] == 0:
+            flags.append("inactive")
+        if r['recent_answers'] >= 5 and r['recent_accuracy'] < 0.5:
+            flags.append("low_recent_accuracy")
+        if r['elo_growth'] < 0:
+            flags.append("negative_growth")
+        if avg_elo < 1000:
+            flags.append("low_elo")
+
+        students.append({
+            "id": r['id'],
+            "full_name": r['full_name'],
+            "average_elo": avg_elo,
+            "mastered_concepts": r['mastered_concepts'],
+            "total_concepts": total_concepts,
+            "attempts": r['attempts'],
+            "total_answers": r['total_answers'],
+            "recent_answers": r['recent_answers'],
+            "recent_accuracy": round(r['recent_accuracy'], 3) if r['recent_accuracy'] is not None else None,
+            "elo_growth": r['elo_growth'],
+            "remediation_flags": flags
+        })
+
+    return {"role": role, "students": students}
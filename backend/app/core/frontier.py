@@ -0,0 +1,64 @@
+from .config import MASTERY_THRESHOLD
+
+# Per-student ready/locked/mastered frontier. Built once from the
+# student's mastered concepts and kept in the student's hot state
+# (student_state.py); submit_answer then maintains it through the
+# successor adjacency when a concept's mastery flips.
+
+
+def is_mastered_row(row):
+    return bool(row['is_mastered']) or row['current_elo'] >= MASTERY_THRESHOLD
+
+
+class StudentFrontier:
+    def __init__(self, curriculum, mastered_ids):
+        self.curriculum_version = curriculum.version
+        self.mastered = {cid for cid in mastered_ids if cid in curriculum.concept_by_id}
+        self.ready = set()
+        self.locked = set()
+        # Number of unmastered prerequisites per concept
+        self.unmet = {}
+
+        for c in curriculum.concepts:
+            cid = c['concept_id']
+            unmet = sum(1 for p_id in c['prerequisites'] if p_id not in self.mastered)
+            self.unmet[cid] = unmet
+            if cid in self.mastered:
+                continue
+            if unmet == 0:
+                self.ready.add(cid)
+            else:
+                self.locked.add(cid)
+
+    def status(self, concept_id):
+        if concept_id in self.mastered:
+            return "mastered"
+        if concept_id in self.ready:
+            return "ready"
+        return "locked"
+
+    def set_mastered(self, curriculum, concept_id, is_mastered):
+        if concept_id not in self.unmet or (concept_id in self.mastered) == is_mastered:
+            return False
+
+        if is_mastered:
+            self.mastered.add(concept_id)
+            self.ready.discard(concept_id)
+            self.locked.discard(concept_id)
+            for s_id in curriculum.successors.get(concept_id, []):
+                self.unmet[s_id] -= 1
+                if self.unmet[s_id] == 0 and s_id not in self.mastered:
+                    self.locked.discard(s_id)
+                    self.ready.add(s_id)
+        else:
+            self.mastered.discard(concept_id)
+            if self.unmet[concept_id] == 0:
+                self.ready.add(concept_id)
+            else:
+                self.locked.add(concept_id)
+            for s_id in curriculum.successors.get(concept_id, []):
+                self.unmet[s_id] += 1
+                if s_id in self.ready:
+                    self.ready.discard(s_id)
+                    self.locked.add(s_id)
+        return True
@@ -0,0 +1,180 @@
+import time
+import asyncio
+import logging
+from psycopg import errors
+from .config import LOG_BUFFER_SIZE, LOG_FLUSH_BATCH_SIZE, LOG_FLUSH_INTERVAL, LOG_ENQUEUE_TIMEOUT, LOG_FLUSH_MAX_RETRIES
+from .database import get_async_db_connection, release_async_db_connection
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+LOG_COLUMNS = ("user_id", "question_id", "concept_id", "is_correct", "old_elo", "new_elo", "elo_change", "created_at")
+COPY_SQL = f"COPY learning_logs ({', '.join(LOG_COLUMNS)}) FROM STDIN"
+
+# Process-wide buffer, only created when LOG_WRITE_BEHIND is enabled
+_buffer = None
+
+
+class LogBuffer:
+    """Bounded in-process buffer of learning_logs rows, flushed with COPY."""
+
+    def __init__(self, max_size=LOG_BUFFER_SIZE, batch_size=LOG_FLUSH_BATCH_SIZE,
+                 flush_interval=LOG_FLUSH_INTERVAL, enqueue_timeout=LOG_ENQUEUE_TIMEOUT,
+                 max_retries=LOG_FLUSH_MAX_RETRIES):
+        if batch_size > max_size:
+            raise ValueError(f"LOG_FLUSH_BATCH_SIZE ({batch_size}) must not exceed LOG_BUFFER_SIZE ({max_size})")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.max_retries = max_retries
+        self._queue = asyncio.Queue(maxsize=max_size)
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        # Batch whose COPY failed; retried before anything else is dequeued
+        self._retry = []
+        self._retry_attempts = 0
+        self._task = None
+        self.queued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.failed_flushes = 0
+
+    async def put(self, row):
+        # Backpressure: wait for room up to enqueue_timeout, then drop
+        try:
+            await asyncio.wait_for(self._queue.put(row), self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            self._drop([row])
+            logger.warning("learning_logs buffer full, dropped row for %s", row[0])
+            return False
+        self.queued += 1
+        metrics.log_buffer_rows.inc(1, "queued")
+        if self._queue.qsize() >= self.batch_size or self._queue.full():
+            self._wakeup.set()
+        return True
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Durable shutdown: drain everything that is still buffered
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        async with self._flush_lock:
+            while self._retry or not self._queue.empty():
+                batch = self._retry
+                while len(batch) < self.batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                try:
+                    await self._copy(batch)
+                except (errors.IntegrityError, errors.DataError):
+                    # Would fail on every retry; write the rows one by one and drop the bad ones
+                    logger.exception("learning_logs batch of %d rows rejected, retrying row by row", len(batch))
+                    if not await self._copy_rows(batch):
+                        return
+                    continue
+                except Exception:
+                    self.failed_flushes += 1
+                    self._retry_attempts += 1
+                    if self._retry_attempts < self.max_retries:
+                        self._retry = batch
+                        logger.exception("Failed to flush %d learning_logs rows", len(batch))
+                        return
+                    self._drop(batch)
+                    logger.exception("Dropped %d learning_logs rows after %d failed flushes", len(batch), self._retry_attempts)
+                    self._retry, self._retry_attempts = [], 0
+                    return
+                self._retry, self._retry_attempts = [], 0
+                self.flushed += len(batch)
+                metrics.log_buffer_rows.inc(len(batch), "flushed")
+
+    async def _copy_rows(self, batch):
+        for i, row in enumerate(batch):
+            try:
+                await self._copy([row])
+            except (errors.IntegrityError, errors.DataError) as e:
+                self._drop([row])
+                logger.error("Dropped learning_logs row %r: %s", row, e)
+                continue
+            except Exception:
+                # Not the rows' fault; keep the rest for the next flush
+                self.failed_flushes += 1
+                self._retry = batch[i:]
+                logger.exception("Failed to flush %d learning_logs rows", len(self._retry))
+                return False
+            self.flushed += 1
+            metrics.log_buffer_rows.inc(1, "flushed")
+        self._retry, self._retry_attempts = [], 0
+        return True
+
+    def _drop(self, rows):
+        self.dropped += len(rows)
+        metrics.log_buffer_rows.inc(len(rows), "dropped")
+
+    async def _copy(self, batch):
+        conn = await get_async_db_connection()
+        try:
+            start = time.perf_counter()
+            async with conn.cursor() as cur:
+                async with cur.copy(COPY_SQL) as copy:
+                    for row in batch:
+                        await copy.write_row(row)
+            await conn.commit()
+            metrics.observe_query(COPY_SQL, time.perf_counter() - start, len(batch))
+        finally:
+            await release_async_db_connection(conn)
+
+    def stats(self):
+        return {
+            "queued": self.queued,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "pending": self._queue.qsize() + len(self._retry),
+            "failed_flushes": self.failed_flushes
+        }
+
+
+def _pending_rows():
+    if _buffer is None:
+        return {}
+    return {(): _buffer._queue.qsize() + len(_buffer._retry)}
+
+metrics.register(metrics.Gauge(
+    "adaptive_log_buffer_pending_rows", "learning_logs rows waiting in the write-behind buffer.", callback=_pending_rows))
+
+
+def get_log_buffer():
+    return _buffer
+
+
+def start_log_buffer():
+    global _buffer
+    if _buffer is None:
+        _buffer = LogBuffer()
+        _buffer.start()
+    return _buffer
+
+
+async def stop_log_buffer():
+    global _buffer
+    if _buffer is not None:
+        await _buffer.stop()
+        _buffer = None
@@ -0,0 +1,207 @@
+import re
+import time
+import hashlib
+from bisect import bisect_left
+
+# Minimal in-process metrics rendered in the Prometheus text format.
+# Everything runs on the event loop thread, so observations are plain
+# dict/list updates without locks.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for n, v in zip(names, values):
+        v = str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{n}="{v}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [bucket counts..., sum, count]
+        self._series = {}
+
+    def observe(self, value, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+        i = bisect_left(self.buckets, value)
+        if i < len(self.buckets):
+            series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        names = self.labels + ("le",)
+        for label_values, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(names, label_values + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(names, label_values + ('+Inf',))} {series[-1]}")
+            base = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{base} {series[-2]}")
+            lines.append(f"{self.name}_count{base} {series[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+
+    def inc(self, amount=1, *label_values):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for label_values, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Gauge:
+    # Either set directly or computed at scrape time through a callback
+    # returning {label values: value}.
+    def __init__(self, name, help_text, labels=(), callback=None):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.callback = callback
+        self._values = {}
+
+    def set(self, value, *label_values):
+        self._values[label_values] = value
+
+    def inc(self, amount=1, *label_values):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def dec(self, amount=1, *label_values):
+        self.inc(-amount, *label_values)
+
+    def render(self):
+        values = self.callback() if self.callback else self._values
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        for label_values, value in values.items():
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+_registry = []
+
+
+def register(metric):
+    _registry.append(metric)
+    return metric
+
+
+def render_metrics():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Query fingerprints: SQL text is normalized once per distinct statement and
+# reduced to a short hash, which keeps the query label low-cardinality.
+_WHITESPACE = re.compile(r"\s+")
+_fingerprints = {}
+
+
+def normalize_query(query):
+    return _WHITESPACE.sub(" ", str(query)).strip()
+
+
+def query_fingerprint(query):
+    fp = _fingerprints.get(query)
+    if fp is None:
+        statement = normalize_query(query)
+        fp = hashlib.sha1(statement.encode()).hexdigest()[:12]
+        _fingerprints[query] = fp
+        query_info.set(1, fp, statement[:200])
+    return fp
+
+
+http_request_duration = register(Histogram(
+    "adaptive_http_request_duration_seconds", "HTTP request latency by route.",
+    labels=("method", "route", "status")))
+db_query_duration = register(Histogram(
+    "adaptive_db_query_duration_seconds", "Database query latency by query fingerprint.",
+    labels=("query",)))
+db_query_rows = register(Counter(
+    "adaptive_db_query_rows_total", "Rows returned or affected by query fingerprint.",
+    labels=("query",)))
+db_query_errors = register(Counter(
+    "adaptive_db_query_errors_total", "Failed queries by query fingerprint.",
+    labels=("query",)))
+query_info = register(Gauge(
+    "adaptive_db_query_info", "Statement text behind each query fingerprint.",
+    labels=("query", "statement")))
+db_slow_queries = register(Counter(
+    "adaptive_db_slow_queries_total", "Queries slower than SLOW_QUERY_THRESHOLD_MS by query fingerprint.",
+    labels=("query",)))
+invalidation_messages = register(Counter(
+    "adaptive_invalidation_messages_total", "Invalidation messages received from other processes.",
+    labels=("channel",)))
+db_pool_wait = register(Histogram(
+    "adaptive_db_pool_wait_seconds", "Time spent waiting for a pooled connection."))
+db_pool_in_use = register(Gauge(
+    "adaptive_db_pool_connections_in_use", "Connections currently checked out of the async pool."))
+db_pool_in_use.set(0)
+log_buffer_rows = register(Counter(
+    "adaptive_log_buffer_rows_total", "learning_logs rows through the write-behind buffer by outcome (queued, flushed, dropped).",
+    labels=("outcome",)))
+db_pool_timeouts = register(Counter(
+    "adaptive_db_pool_timeouts_total", "Checkouts that gave up after DB_POOL_TIMEOUT."))
+
+
+def observe_query(query, elapsed, rows):
+    fp = query_fingerprint(query)
+    db_query_duration.observe(elapsed, fp)
+    if rows:
+        db_query_rows.inc(rows, fp)
+
+
+class RequestLatencyMiddleware:
+    """Plain ASGI middleware recording adaptive_http_request_duration_seconds.
+    Messages are passed straight through; unlike BaseHTTPMiddleware no task
+    or memory stream is added and streamed bodies are not buffered."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+        end = None
+
+        async def send_timed(message):
+            nonlocal status, end
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                # Until the last body chunk, before any background task runs
+                end = time.perf_counter()
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            # Label by route template, not raw path, to keep cardinality bounded
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            http_request_duration.observe((end or time.perf_counter()) - start, scope["method"], path, status)
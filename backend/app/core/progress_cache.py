@@ -0,0 +1,113 @@
+from collections import OrderedDict, deque
+from .config import PROGRESS_CACHE_SIZE, PROGRESS_HISTORY_SIZE
+from .serialization import dumps
+from .database import activity_date, fetch_one
+
+# Rendered /student-progress snapshots and the versions they are served
+# under. A progress version combines the curriculum's content hash, the
+# student's activity counters (changed by every submit) and the activity
+# day, all read from shared data, so every process computes the same
+# ETag and can answer a conditional request or a delta from its own cache.
+_payloads = OrderedDict()
+
+# Keyed lists sent as changed items only in delta mode
+DELTA_LIST_KEYS = {"concepts": "id", "chapters": "id", "progress_details": "concept_id"}
+
+
+STUDENT_VERSION_SQL = """
+    SELECT total_answers, updated_at FROM student_activity_counters WHERE user_id = %s
+"""
+
+
+def shared_student_version(row):
+    # (answers, counters updated_at in microseconds); (0, 0) before the first answer
+    if not row or row['total_answers'] is None:
+        return (0, 0)
+    return (int(row['total_answers']), int(row['updated_at'].timestamp() * 1_000_000))
+
+
+async def fetch_student_version(student_id, conn):
+    return shared_student_version(await fetch_one(conn, STUDENT_VERSION_SQL, (student_id,)))
+
+
+def progress_version(curriculum_version, student_version):
+    # today_questions rolls over at midnight in the activity time zone, the
+    # same day the SQL counts it for, so the date is part of the version
+    answers, changed_at = student_version
+    return f"{curriculum_version}-{answers}.{changed_at:x}-{activity_date().isoformat()}"
+
+
+def progress_etag(version):
+    return f'W/"{version}"'
+
+
+class ProgressEntry:
+    def __init__(self, version, curriculum_version, payload, history):
+        self.version = version
+        self.curriculum_version = curriculum_version
+        self.payload = payload
+        self.body = dumps(payload)
+        # Older (version, curriculum_version, payload) snapshots, newest last
+        self.history = history
+
+
+def get_progress_entry(student_id, version):
+    entry = _payloads.get(student_id)
+    if entry is None or entry.version != version:
+        return None
+    _payloads.move_to_end(student_id)
+    return entry
+
+
+def store_progress(student_id, version, curriculum_version, payload):
+    previous = _payloads.get(student_id)
+    history = deque(maxlen=PROGRESS_HISTORY_SIZE)
+    if previous is not None:
+        history = previous.history
+        if previous.version != version:
+            history.append((previous.version, previous.curriculum_version, previous.payload))
+    entry = _payloads[student_id] = ProgressEntry(version, curriculum_version, {**payload, "version": version}, history)
+    _payloads.move_to_end(student_id)
+    while len(_payloads) > PROGRESS_CACHE_SIZE:
+        _payloads.popitem(last=False)
+    return entry
+
+
+def _changed_items(old_items, new_items, key):
+    old_by_key = {item[key]: item for item in old_items}
+    return [item for item in new_items if old_by_key.get(item[key]) != item]
+
+
+def progress_delta(entry, since_version):
+    """Changes from the snapshot the client saw as since_version, or None if
+    that snapshot is gone or was built from another curriculum."""
+    if since_version == entry.version:
+        base = entry.payload
+    else:
+        base = next((p for v, cv, p in entry.history
+                     if v == since_version and cv == entry.curriculum_version), None)
+        if base is None:
+            return None
+    new = entry.payload
+    delta = {"mode": "delta", "since_version": since_version, "version": entry.version}
+    for field, value in new.items():
+        if field in DELTA_LIST_KEYS:
+            delta[field] = _changed_items(base[field], value, DELTA_LIST_KEYS[field])
+        elif field != "version" and base.get(field) != value:
+            delta[field] = value
+    return delta
+
+
+def project_fields(payload, fields):
+    # Bookkeeping keys always pass through
+    return {k: v for k, v in payload.items() if k in fields or k in ("mode", "version", "since_version")}
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as required for If-None-Match
+    strip = lambda t: t.strip()[2:] if t.strip().startswith("W/") else t.strip()
+    return any(strip(t) == strip(etag) for t in if_none_match.split(","))
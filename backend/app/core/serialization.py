@@ -0,0 +1,27 @@
+from decimal import Decimal
+import orjson
+from fastapi.responses import Response
+
+# Internally built payloads skip Pydantic validation and jsonable_encoder:
+# orjson serializes datetimes, dates and UUIDs natively.
+_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def _default(o):
+    if isinstance(o, Decimal):
+        return float(o)
+    raise TypeError(f"Type is not JSON serializable: {type(o).__name__}")
+
+
+def dumps(data):
+    return orjson.dumps(data, default=_default, option=_OPTIONS)
+
+
+class FastJSONResponse(Response):
+    # Also accepts an already rendered body, e.g. from a payload cache
+    media_type = "application/json"
+
+    def render(self, content):
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
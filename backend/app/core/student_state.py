@@ -0,0 +1,171 @@
+import time
+import itertools
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+from .config import PROGRESS_CACHE_SIZE, STUDENT_STATE_CACHE_SIZE, STUDENT_STATE_IDLE_SECONDS, DEFAULT_ELO
+from .database import fetch_all
+from .frontier import StudentFrontier, is_mastered_row
+from .progress_cache import fetch_student_version
+
+# Hot state of active students, indexed by concept ordinal: ELO vector,
+# mastery flags, attempt counts and the frontier. Loaded from
+# student_mastery on a miss; concepts without a row sit at DEFAULT_ELO.
+# Submits write through (the submit statement upserts the row, then
+# apply_answer updates the cached arrays). Bounded
+# by STUDENT_STATE_CACHE_SIZE and dropped after STUDENT_STATE_IDLE_SECONDS.
+# Each state records the shared student version (activity counters) it was
+# loaded at, so /student-progress can tell whether it is current.
+_states = OrderedDict()
+# Submits per student between their statement and commit/rollback
+_writes_in_flight = {}
+# Local change stamps, bumped by every submit and invalidation, so a load
+# can tell whether the student changed while it read. They come from one
+# process-wide counter, so an evicted stamp is never reused.
+_stamp_counter = itertools.count(1)
+_stamps = OrderedDict()
+
+MASTERY_SQL = """
+    SELECT concept_id, current_elo, is_mastered, total_attempts, updated_at
+    FROM student_mastery
+    WHERE user_id = %s
+"""
+
+
+class StudentState:
+    __slots__ = ("curriculum_version", "version", "elo", "mastered", "attempts", "updated_at", "frontier", "last_used")
+
+    def __init__(self, curriculum, version, rows):
+        n = len(curriculum.concepts)
+        index = curriculum.concept_index
+        self.curriculum_version = curriculum.version
+        # Read before the rows, so the rows are at least this recent
+        self.version = version
+        self.elo = array('i', [DEFAULT_ELO]) * n
+        self.mastered = bytearray(n)
+        self.attempts = array('i', [0]) * n
+        self.updated_at = [None] * n
+
+        mastered_ids = []
+        for r in rows:
+            i = index.get(r['concept_id'])
+            if i is None:
+                continue
+            self.elo[i] = int(r['current_elo'])
+            self.mastered[i] = bool(r['is_mastered'])
+            self.attempts[i] = r['total_attempts'] or 0
+            self.updated_at[i] = r['updated_at']
+            if is_mastered_row(r):
+                mastered_ids.append(r['concept_id'])
+        self.frontier = StudentFrontier(curriculum, mastered_ids)
+        self.last_used = time.monotonic()
+
+
+def _change_stamp(student_id):
+    stamp = _stamps.get(student_id)
+    if stamp is None:
+        stamp = _stamps[student_id] = next(_stamp_counter)
+        while len(_stamps) > PROGRESS_CACHE_SIZE:
+            _stamps.popitem(last=False)
+    else:
+        _stamps.move_to_end(student_id)
+    return stamp
+
+
+def _bump_change_stamp(student_id):
+    _stamps[student_id] = next(_stamp_counter)
+    _stamps.move_to_end(student_id)
+    while len(_stamps) > PROGRESS_CACHE_SIZE:
+        _stamps.popitem(last=False)
+
+
+def _evict_idle(now):
+    while len(_states) > STUDENT_STATE_CACHE_SIZE:
+        _states.popitem(last=False)
+    # Least recently used first, so idle entries sit at the front
+    while _states:
+        student_id, state = next(iter(_states.items()))
+        if now - state.last_used <= STUDENT_STATE_IDLE_SECONDS:
+            break
+        del _states[student_id]
+
+
+async def get_student_state(student_id, curriculum, conn, version=None):
+    # With version given, a cached state loaded at another version is reloaded
+    now = time.monotonic()
+    state = _states.get(student_id)
+    if (state is not None and state.curriculum_version == curriculum.version
+            and (version is None or state.version == version)
+            and now - state.last_used <= STUDENT_STATE_IDLE_SECONDS):
+        state.last_used = now
+        _states.move_to_end(student_id)
+        return state
+
+    stamp = _change_stamp(student_id)
+    busy = _writes_in_flight.get(student_id)
+    shared_version = await fetch_student_version(student_id, conn)
+    state = StudentState(curriculum, shared_version, await fetch_all(conn, MASTERY_SQL, (student_id,)))
+    # A submit in flight or committed while reading may not be in the rows
+    # just read; use them for this request only.
+    if busy or _writes_in_flight.get(student_id) or _change_stamp(student_id) != stamp:
+        _states.pop(student_id, None)
+    else:
+        _states[student_id] = state
+        _states.move_to_end(student_id)
+        _evict_idle(now)
+    return state
+
+
+def apply_answer(student_id, curriculum, concept_id, new_elo, is_mastered, updated_at, version):
+    state = _states.get(student_id)
+    if state is None or state.curriculum_version != curriculum.version:
+        return
+    i = curriculum.concept_index.get(concept_id)
+    # The state must be exactly one answer behind; otherwise it missed a
+    # write (e.g. from another process) and is reloaded instead
+    if i is None or version[0] != state.version[0] + 1:
+        evict_student_state(student_id)
+        return
+    state.version = version
+    state.elo[i] = new_elo
+    state.mastered[i] = is_mastered
+    state.attempts[i] += 1
+    state.updated_at[i] = updated_at
+    state.frontier.set_mastered(curriculum, concept_id, is_mastered)
+
+
+def evict_student_state(student_id):
+    _states.pop(student_id, None)
+
+
+def on_student_changed(student_id):
+    # Another process wrote this student's mastery; None means messages
+    # may have been missed, so nothing cached can be trusted
+    if student_id is None:
+        _states.clear()
+        _stamps.clear()
+        return
+    evict_student_state(student_id)
+    _bump_change_stamp(student_id)
+
+
+@contextmanager
+def student_write(student_id):
+    """Wrap a submit from its statement to its commit. On error the hot
+    state is dropped so it cannot keep a rolled-back update. Until the
+    commit, /student-progress does not build from the updated state: the
+    state carries the uncommitted version, which differs from the committed
+    one progress asks for, so it reloads from the database instead."""
+    _writes_in_flight[student_id] = _writes_in_flight.get(student_id, 0) + 1
+    try:
+        yield
+    except BaseException:
+        evict_student_state(student_id)
+        raise
+    finally:
+        _bump_change_stamp(student_id)
+        remaining = _writes_in_flight[student_id] - 1
+        if remaining:
+            _writes_in_flight[student_id] = remaining
+        else:
+            del _writes_in_flight[student_id]
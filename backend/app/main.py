@@ -1,8 +1,44 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from .api import auth, student, engine
+from fastapi.responses import JSONResponse, PlainTextResponse
+from psycopg_pool import PoolTimeout
+from .api import auth, student, engine, admin
+from .core.database import (
+    init_async_db_pool, close_async_db_pool, get_async_db_connection, release_async_db_connection,
+    start_notification_listener, stop_notification_listener, CURRICULUM_CHANNEL, STUDENT_CHANNEL
+)
+from .core.config import LOG_WRITE_BEHIND, METRICS_ENABLED, INVALIDATION_BUS_ENABLED
+from .core import metrics
+from .core.curriculum import load_curriculum, on_curriculum_changed
+from .core.student_state import on_student_changed
+from .core.log_buffer import start_log_buffer, stop_log_buffer
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await init_async_db_pool()
+    if INVALIDATION_BUS_ENABLED:
+        # Listen before the first load so no change slips in between
+        await start_notification_listener({
+            CURRICULUM_CHANNEL: on_curriculum_changed,
+            STUDENT_CHANNEL: on_student_changed
+        })
+    conn = await get_async_db_connection()
+    try:
+        await load_curriculum(conn)
+    finally:
+        await release_async_db_connection(conn)
+    if LOG_WRITE_BEHIND:
+        start_log_buffer()
+    try:
+        yield
+    finally:
+        # Flush buffered learning_logs before the pool goes away
+        await stop_log_buffer()
+        await stop_notification_listener()
+        await close_async_db_pool()
 
-app = FastAPI(title="Adaptive Engine API (Modular)")
+app = FastAPI(title="Adaptive Engine API (Modular)", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -12,15 +48,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if METRICS_ENABLED:
+    app.add_middleware(metrics.RequestLatencyMiddleware)
+
 # Include Routers
 app.include_router(auth.router, tags=["auth"])
 app.include_router(student.router, tags=["student"])
 app.include_router(engine.router, tags=["engine"])
+app.include_router(admin.router, tags=["admin"])
+
+@app.exception_handler(PoolTimeout)
+async def pool_timeout_handler(request: Request, exc: PoolTimeout):
+    # No connection became free within DB_POOL_TIMEOUT; tell clients to back off
+    return JSONResponse(status_code=503, content={"detail": "Database connection pool exhausted"})
 
 @app.get("/")
 def health_check():
     return {"status": "ok", "message": "Adaptive Engine API is running"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render_metrics(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
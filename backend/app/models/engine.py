@@ -30,3 +30,7 @@ class SubmitResponse(BaseModel):
     elo_change: float
     is_mastered: bool
     mastery_threshold: int = MASTERY_THRESHOLD
+
+class SubmitAndNextResponse(BaseModel):
+    submit: SubmitResponse
+    next: StatusResponse
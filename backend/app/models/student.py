@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from typing import List, Optional
+from uuid import UUID
 
 class ProgressResponse(BaseModel):
     total_concepts: int
@@ -17,3 +18,21 @@ class ProgressResponse(BaseModel):
     needs_attention: List[dict]
     recent_achievements: List[dict]
     progress_details: List[dict]
+    version: Optional[str] = None
+
+class ClassStudentSummary(BaseModel):
+    id: UUID
+    full_name: Optional[str] = None
+    average_elo: int
+    mastered_concepts: int
+    total_concepts: int
+    attempts: int
+    total_answers: int
+    recent_answers: int
+    recent_accuracy: Optional[float] = None
+    elo_growth: int
+    remediation_flags: List[str]
+
+class ClassOverviewResponse(BaseModel):
+    role: str
+    students: List[ClassStudentSummary]
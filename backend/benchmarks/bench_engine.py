@@ -0,0 +1,270 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import gc
+import hashlib
+import platform
+import statistics
+import subprocess
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core import curriculum as curriculum_cache
+from app.core import student_state
+from app.core.config import MASTERY_THRESHOLD
+from app.core.engine_logic import select_next_question_logic, get_student_progress_logic
+
+HISTORY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "history.jsonl")
+DEFAULT_SIZES = ["30x100", "1000x100000", "10000x100000"]
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, query, params=None):
+        self.rows = self.conn.route(query, params)
+
+    async def fetchall(self):
+        return [dict(r) for r in self.rows]
+
+    async def fetchone(self):
+        return dict(self.rows[0]) if self.rows else None
+
+
+class FakeConnection:
+    """Answers the engine's queries from in-memory rows so only the Python side is timed."""
+
+    def __init__(self, concepts, questions, mastery_by_student):
+        self.concepts = concepts
+        self.questions = questions
+        self.mastery_by_student = mastery_by_student
+
+    def cursor(self, row_factory=None):
+        return FakeCursor(self)
+
+    def route(self, query, params):
+        if "FROM concepts c" in query:
+            return self.concepts
+        if "FROM questions" in query:
+            return self.questions
+        if "FROM student_mastery" in query:
+            return self.mastery_by_student.get(params[0], [])
+        if "SELECT total_answers, updated_at" in query:
+            return []
+        if "student_activity_counters" in query:
+            return [{"total_questions": 0, "today_questions": 0}]
+        raise ValueError(f"Unexpected query in benchmark: {query.strip()[:60]}")
+
+
+def parse_size(size):
+    concepts, questions = size.lower().split("x")
+    return int(concepts), int(questions)
+
+
+def build_dataset(num_concepts, num_questions, num_students, mastered_fraction, seed):
+    rng = random.Random(seed)
+    chapter_size = max(1, min(50, num_concepts // 10 or 1))
+    concepts = []
+    for i in range(num_concepts):
+        # Prerequisites always point backwards, so the graph stays acyclic
+        # and any prefix of the concept list is prerequisite-closed.
+        k = rng.randint(0, min(3, i))
+        prereqs = [f"C{j:05d}" for j in sorted(rng.sample(range(max(0, i - 50), i), k))] if k else []
+        ch = i // chapter_size
+        concepts.append({
+            "concept_id": f"C{i:05d}",
+            "concept_name": f"Concept {i}",
+            "chapter_id": ch + 1,
+            "prerequisites": prereqs,
+            "chapter_name": f"Chapter {ch + 1}",
+            "chapter_order": ch,
+        })
+
+    options = [{"text": "A", "is_correct": True}, {"text": "B"}, {"text": "C"}, {"text": "D"}]
+    questions = [{
+        "id": f"Q{n:07d}",
+        "concept_id": f"C{rng.randrange(num_concepts):05d}",
+        "content_text": f"Question {n}",
+        "options": options,
+        "difficulty_elo": rng.randint(700, 1600),
+    } for n in range(num_questions)]
+
+    now = datetime.now(timezone.utc)
+    mastery_by_student = {}
+    for s in range(num_students):
+        sid = f"00000000-0000-0000-0000-{s:012d}"
+        cutoff = int(num_concepts * mastered_fraction)
+        rows = []
+        for i, c in enumerate(concepts):
+            mastered = i < cutoff
+            rows.append({
+                "concept_id": c["concept_id"],
+                "current_elo": rng.randint(MASTERY_THRESHOLD, MASTERY_THRESHOLD + 200) if mastered else rng.randint(800, MASTERY_THRESHOLD - 1),
+                "is_mastered": mastered,
+                "total_attempts": rng.randint(0, 20),
+                "updated_at": now,
+            })
+        mastery_by_student[sid] = rows
+    return FakeConnection(concepts, questions, mastery_by_student)
+
+
+async def measure(fn, min_iters, min_time):
+    gc.collect()
+    times = []
+    start = time.perf_counter()
+    while len(times) < min_iters or (time.perf_counter() - start < min_time and len(times) < 1000):
+        t0 = time.perf_counter()
+        await fn()
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+async def bench_case(size, args):
+    num_concepts, num_questions = parse_size(size)
+    conn = build_dataset(num_concepts, num_questions, args.students, args.mastered, args.seed)
+    student_ids = list(conn.mastery_by_student)
+    random.seed(args.seed)
+    curriculum_cache.invalidate_curriculum()
+    student_state._states.clear()
+
+    async def load():
+        await curriculum_cache.load_curriculum(conn)
+
+    turn = iter(range(10 ** 9))
+
+    def next_student():
+        return student_ids[next(turn) % len(student_ids)]
+
+    async def select_warm():
+        await select_next_question_logic(next_student(), conn)
+
+    async def select_cold():
+        sid = next_student()
+        student_state.evict_student_state(sid)
+        await select_next_question_logic(sid, conn)
+
+    async def progress_warm():
+        await get_student_progress_logic(next_student(), conn)
+
+    async def progress_cold():
+        sid = next_student()
+        student_state.evict_student_state(sid)
+        await get_student_progress_logic(sid, conn)
+
+    results = {}
+    results["load_curriculum"] = await measure(load, 3, args.min_time)
+    # Warm every student's state once so the warm variants measure steady state
+    for sid in student_ids:
+        await select_next_question_logic(sid, conn)
+    for name, fn in (("select_next_question", select_warm), ("select_next_question_cold", select_cold),
+                     ("student_progress", progress_warm), ("student_progress_cold", progress_cold)):
+        results[name] = await measure(fn, args.min_iters, args.min_time)
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def host_fingerprint():
+    # Timings only compare within one machine and interpreter build
+    info = {
+        "node": platform.node(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count(),
+        "python": f"{platform.python_implementation()} {platform.python_version()}",
+    }
+    info["host"] = hashlib.sha1(json.dumps(info, sort_keys=True).encode()).hexdigest()[:12]
+    return info
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def baseline_for(history, host, size, function, runs):
+    previous = [h["median_ms"] for h in history
+                if h.get("host") == host and h["size"] == size and h["function"] == function]
+    if not previous:
+        return None
+    return statistics.median(previous[-runs:])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark engine selection and progress logic against synthetic curricula.")
+    parser.add_argument("--sizes", nargs="+", default=DEFAULT_SIZES,
+                        help="Curriculum sizes as CONCEPTSxQUESTIONS, e.g. 30x100 10000x1000000")
+    parser.add_argument("--students", type=int, default=20)
+    parser.add_argument("--mastered", type=float, default=0.3, help="Fraction of concepts already mastered")
+    parser.add_argument("--min-iters", type=int, default=20)
+    parser.add_argument("--min-time", type=float, default=1.0, help="Minimum seconds spent per function")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--history", default=HISTORY_PATH, help="Local run history, not committed")
+    parser.add_argument("--baseline-runs", type=int, default=5, help="Previous runs the baseline median is taken over")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown before a function counts as regressed")
+    parser.add_argument("--no-record", action="store_true", help="Compare against history without appending to it")
+    args = parser.parse_args()
+
+    history = load_history(args.history)
+    run = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "revision": git_revision(),
+        **host_fingerprint(),
+    }
+    print(f"host {run['host']}: {run['node']}, {run['platform']}, {run['cpus']} CPUs, {run['python']}")
+
+    records = []
+    regressions = []
+    print(f"{'size':<16}{'function':<28}{'median ms':>11}{'min ms':>10}{'iters':>7}{'baseline':>10}{'change':>9}")
+    for size in args.sizes:
+        results = asyncio.run(bench_case(size, args))
+        for function, times in results.items():
+            median_ms = statistics.median(times) * 1000
+            record = {**run, "size": size, "function": function, "median_ms": round(median_ms, 4),
+                      "min_ms": round(min(times) * 1000, 4), "iterations": len(times)}
+            records.append(record)
+
+            baseline = baseline_for(history, run["host"], size, function, args.baseline_runs)
+            change = ""
+            if baseline:
+                ratio = median_ms / baseline - 1
+                change = f"{ratio:+.0%}"
+                if ratio > args.threshold:
+                    regressions.append(f"{size} {function}: {median_ms:.3f} ms vs baseline {baseline:.3f} ms ({change})")
+            print(f"{size:<16}{function:<28}{median_ms:>11.3f}{record['min_ms']:>10.3f}{len(times):>7}"
+                  f"{f'{baseline:.3f}' if baseline else '-':>10}{change:>9}")
+
+    if not args.no_record:
+        with open(args.history, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+
+    for msg in regressions:
+        print(f"❌ Regression: {msg}")
+    if not regressions:
+        print("✅ No regressions beyond threshold.")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
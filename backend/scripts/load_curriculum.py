@@ -0,0 +1,261 @@
+import os
+import csv
+import time
+import argparse
+from collections import defaultdict, deque
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv()
+DB_URL = os.environ.get("DB_URL")
+
+DOCS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "docs")
+
+# Running API workers drop their curriculum cache when this fires
+# (same channel as CURRICULUM_CHANNEL in app/core/database.py).
+CURRICULUM_CHANNEL = "adaptive_curriculum"
+
+# Each CSV is streamed with COPY into a staging table. Columns after the
+# required ones are optional; ord keeps the file order for chapter
+# ordering and prerequisite order.
+STAGING_SQL = """
+    CREATE TEMP TABLE stage_nodes (ord bigserial, concept_id text, name text) ON COMMIT DROP;
+    CREATE TEMP TABLE stage_map (concept_id text, chapter text) ON COMMIT DROP;
+    CREATE TEMP TABLE stage_edges (ord bigserial, source text, target text) ON COMMIT DROP;
+    CREATE TEMP TABLE stage_questions (
+        question_id text, concept_id text, elo_difficulty integer, content_text text, options jsonb
+    ) ON COMMIT DROP;
+"""
+
+FILES = {
+    "nodes": ("stage_nodes", ("concept_id",), ("name",)),
+    "concept_to_chapter_map": ("stage_map", ("concept_id", "chapter"), ()),
+    "edges": ("stage_edges", ("source", "target"), ()),
+    "question_bank": ("stage_questions", ("question_id", "concept_id", "elo_difficulty"), ("content_text", "options")),
+}
+
+VALIDATION_CHECKS = [
+    ("Duplicate concept ids in nodes",
+     "SELECT concept_id FROM stage_nodes GROUP BY concept_id HAVING count(*) > 1"),
+    ("Concepts without a chapter",
+     "SELECT n.concept_id FROM stage_nodes n LEFT JOIN stage_map m USING (concept_id) WHERE m.concept_id IS NULL"),
+    ("Concepts mapped to more than one chapter",
+     "SELECT concept_id FROM stage_map GROUP BY concept_id HAVING count(DISTINCT chapter) > 1"),
+    ("Unknown concept ids in edges",
+     """SELECT DISTINCT x.id FROM stage_edges e CROSS JOIN LATERAL (VALUES (e.source), (e.target)) x(id)
+        LEFT JOIN stage_nodes n ON n.concept_id = x.id WHERE n.concept_id IS NULL"""),
+    ("Duplicate question ids",
+     "SELECT question_id FROM stage_questions GROUP BY question_id HAVING count(*) > 1"),
+    ("Questions with an unknown concept id",
+     """SELECT q.question_id FROM stage_questions q LEFT JOIN stage_nodes n USING (concept_id)
+        WHERE n.concept_id IS NULL"""),
+    ("Questions without a difficulty",
+     "SELECT question_id FROM stage_questions WHERE elo_difficulty IS NULL"),
+    ("Questions whose options are not a non-empty JSON array",
+     """SELECT question_id FROM stage_questions
+        WHERE options IS NOT NULL AND (jsonb_typeof(options) <> 'array' OR options = '[]'::jsonb)"""),
+    # The frontend cannot answer a question without options, so new
+    # questions must bring their text and options
+    ("New questions without content_text or options",
+     """SELECT s.question_id FROM stage_questions s
+        WHERE (s.content_text IS NULL OR s.options IS NULL)
+          AND NOT EXISTS (SELECT 1 FROM questions q WHERE q.id = s.question_id)"""),
+]
+
+# Reported, but do not stop the load
+WARNING_CHECKS = [
+    ("Chapter map entries for concepts not in nodes (ignored)",
+     "SELECT m.concept_id FROM stage_map m LEFT JOIN stage_nodes n USING (concept_id) WHERE n.concept_id IS NULL"),
+    ("Questions in the database still without options (add an options column to fix)",
+     """SELECT q.id FROM questions q LEFT JOIN stage_questions s ON s.question_id = q.id
+        WHERE (q.options IS NULL OR q.options = '[]'::jsonb) AND s.options IS NULL"""),
+]
+
+# Set-based upserts: every UPDATE only touches rows whose values differ, so
+# re-running with unchanged files writes nothing. Names, question text and
+# options of existing rows are only overwritten when the files provide them.
+UPSERT_STEPS = [
+    ("chapters", """
+        CREATE TEMP TABLE stage_chapters ON COMMIT DROP AS
+        SELECT m.chapter AS name, (rank() OVER (ORDER BY min(n.ord)) - 1)::int AS order_index
+        FROM stage_map m JOIN stage_nodes n USING (concept_id)
+        GROUP BY m.chapter
+    """, """
+        UPDATE chapters c SET order_index = s.order_index
+        FROM stage_chapters s
+        WHERE c.name = s.name AND c.order_index IS DISTINCT FROM s.order_index
+    """, """
+        INSERT INTO chapters (name, order_index)
+        SELECT s.name, s.order_index FROM stage_chapters s
+        WHERE NOT EXISTS (SELECT 1 FROM chapters c WHERE c.name = s.name)
+    """),
+    ("concepts", """
+        CREATE TEMP TABLE stage_concepts ON COMMIT DROP AS
+        SELECT n.concept_id, n.name, ch.id AS chapter_id,
+               coalesce(p.prerequisites, '{}') AS prerequisites
+        FROM stage_nodes n
+        JOIN stage_map m USING (concept_id)
+        JOIN chapters ch ON ch.name = m.chapter
+        LEFT JOIN (
+            SELECT target, array_agg(source ORDER BY ord) AS prerequisites
+            FROM stage_edges GROUP BY target
+        ) p ON p.target = n.concept_id
+    """, """
+        UPDATE concepts c
+        SET name = coalesce(s.name, c.name), chapter_id = s.chapter_id, prerequisites = s.prerequisites
+        FROM stage_concepts s
+        WHERE c.id = s.concept_id
+          AND (coalesce(s.name, c.name), s.chapter_id, s.prerequisites)
+              IS DISTINCT FROM (c.name, c.chapter_id, coalesce(c.prerequisites, '{}'))
+    """, """
+        INSERT INTO concepts (id, name, chapter_id, prerequisites)
+        SELECT s.concept_id, coalesce(s.name, s.concept_id), s.chapter_id, s.prerequisites
+        FROM stage_concepts s
+        WHERE NOT EXISTS (SELECT 1 FROM concepts c WHERE c.id = s.concept_id)
+    """),
+    ("questions", None, """
+        UPDATE questions q
+        SET concept_id = s.concept_id,
+            difficulty_elo = s.elo_difficulty,
+            content_text = coalesce(s.content_text, q.content_text),
+            options = coalesce(s.options, q.options)
+        FROM stage_questions s
+        WHERE q.id = s.question_id
+          AND (s.concept_id, s.elo_difficulty, coalesce(s.content_text, q.content_text), coalesce(s.options, q.options))
+              IS DISTINCT FROM (q.concept_id, q.difficulty_elo, q.content_text, q.options)
+    """, """
+        INSERT INTO questions (id, concept_id, content_text, options, difficulty_elo)
+        SELECT s.question_id, s.concept_id, s.content_text, s.options, s.elo_difficulty
+        FROM stage_questions s
+        WHERE NOT EXISTS (SELECT 1 FROM questions q WHERE q.id = s.question_id)
+    """),
+]
+
+
+def copy_csv(cur, path, table, required, optional):
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        header = [h.strip() for h in next(csv.reader([f.readline()]))]
+        missing = [c for c in required if c not in header]
+        if missing:
+            raise ValueError(f"{os.path.basename(path)} is missing columns: {', '.join(missing)}")
+        unknown = [c for c in header if c not in required + optional]
+        if unknown:
+            raise ValueError(f"{os.path.basename(path)} has unknown columns: {', '.join(unknown)}")
+        # The header line is already consumed; COPY streams the rest
+        cur.copy_expert(f"COPY {table} ({', '.join(header)}) FROM STDIN WITH (FORMAT csv)", f)
+    return cur.rowcount
+
+
+def find_cycle(edges):
+    """Return one prerequisite cycle as a list of concept ids, or []."""
+    successors = defaultdict(list)
+    predecessors = defaultdict(list)
+    indegree = defaultdict(int)
+    nodes = set()
+    for source, target in edges:
+        successors[source].append(target)
+        predecessors[target].append(source)
+        indegree[target] += 1
+        nodes.update((source, target))
+    # Kahn's algorithm: whatever cannot be ordered sits on or behind a cycle
+    queue = deque(n for n in nodes if indegree[n] == 0)
+    while queue:
+        n = queue.popleft()
+        for s in successors[n]:
+            indegree[s] -= 1
+            if indegree[s] == 0:
+                queue.append(s)
+    left = {n for n in nodes if indegree[n] > 0}
+    if not left:
+        return []
+    # Every leftover concept has a leftover prerequisite; walking back
+    # through them must revisit a concept, which closes the cycle
+    path, position = [], {}
+    n = min(left)
+    while n not in position:
+        position[n] = len(path)
+        path.append(n)
+        n = next(p for p in predecessors[n] if p in left)
+    return list(reversed(path[position[n]:]))
+
+
+def run_checks(cur, checks):
+    found = []
+    for label, sql in checks:
+        cur.execute(sql + " LIMIT 20")
+        ids = [r[0] for r in cur.fetchall()]
+        if ids:
+            found.append(f"{label}: {', '.join(map(str, ids))}")
+    return found
+
+
+def validate(cur):
+    for w in run_checks(cur, WARNING_CHECKS):
+        print(f"Warning: {w}")
+    errors = run_checks(cur, VALIDATION_CHECKS)
+
+    cur.execute("SELECT source, target FROM stage_edges")
+    cycle = find_cycle(cur.fetchall())
+    if cycle:
+        errors.append(f"Prerequisite cycle: {' -> '.join(cycle + cycle[:1])}")
+    return errors
+
+
+def load_curriculum(data_dir, edges_file, dry_run=False):
+    if not DB_URL:
+        print("Error: DB_URL not found")
+        return False
+
+    print("Connecting to DB...")
+    conn = psycopg2.connect(DB_URL)
+    cur = conn.cursor()
+    start = time.perf_counter()
+    try:
+        cur.execute(STAGING_SQL)
+        for name, (table, required, optional) in FILES.items():
+            path = os.path.join(data_dir, edges_file if name == "edges" else f"{name}.csv")
+            rows = copy_csv(cur, path, table, required, optional)
+            print(f"Staged {rows} rows from {os.path.basename(path)}")
+        for table, _, _ in FILES.values():
+            cur.execute(f"ANALYZE {table}")
+
+        errors = validate(cur)
+        if errors:
+            conn.rollback()
+            for e in errors:
+                print(f"❌ {e}")
+            print("Nothing was written.")
+            return False
+
+        for label, prepare_sql, update_sql, insert_sql in UPSERT_STEPS:
+            if prepare_sql:
+                cur.execute(prepare_sql)
+            cur.execute(update_sql)
+            updated = cur.rowcount
+            cur.execute(insert_sql)
+            print(f"{label}: {cur.rowcount} inserted, {updated} updated")
+
+        if dry_run:
+            conn.rollback()
+            print(f"✅ Dry run finished in {time.perf_counter() - start:.1f}s, changes rolled back.")
+            return True
+
+        cur.execute("SELECT pg_notify(%s, %s)", (CURRICULUM_CHANNEL, "loader:"))
+        conn.commit()
+        print(f"✅ Curriculum loaded in {time.perf_counter() - start:.1f}s.")
+        return True
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Error loading curriculum: {e}")
+        return False
+    finally:
+        cur.close()
+        conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load concepts, chapters and questions from the curriculum CSVs.")
+    parser.add_argument("--data-dir", default=DOCS_DIR, help="Directory with nodes.csv, edges.csv, concept_to_chapter_map.csv and question_bank.csv")
+    parser.add_argument("--edges", default="edges.csv", help="Prerequisite edges file inside --data-dir")
+    parser.add_argument("--dry-run", action="store_true", help="Validate and report changes without committing")
+    args = parser.parse_args()
+    raise SystemExit(0 if load_curriculum(args.data_dir, args.edges, args.dry_run) else 1)
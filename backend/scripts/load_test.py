@@ -0,0 +1,303 @@
+import os
+import io
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import psycopg2
+from dotenv import load_dotenv
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+load_dotenv()
+DB_URL = os.environ.get("DB_URL")
+
+# Synthetic students get stable ids and their own role so they never show
+# up next to real students and can be removed with --cleanup.
+LOADTEST_ROLE = "loadtest"
+LOADTEST_NAMESPACE = uuid.UUID("6f1d3c2a-5b7e-4e0f-9a1d-2c3b4a5d6e7f")
+
+ENDPOINTS = ("next-question", "submit-answer", "submit-and-next")
+
+# Per-student rows removed with the synthetic profiles; tables that do not
+# exist (learning_log_monthly_summary before partitioning) are skipped
+STUDENT_TABLES = ("learning_logs", "learning_log_monthly_summary", "student_mastery",
+                  "student_activity_counters", "student_daily_activity")
+
+
+def student_ids(count):
+    return [str(uuid.uuid5(LOADTEST_NAMESPACE, f"student-{i}")) for i in range(count)]
+
+
+def provision_students(count, initial_elo=None):
+    """Create the synthetic profiles with COPY. Mastery rows are only
+    materialized for a non-default --initial-elo; otherwise the first
+    answer per concept creates them, as for real students."""
+    conn = psycopg2.connect(DB_URL)
+    cur = conn.cursor()
+    try:
+        ids = student_ids(count)
+
+        # Start from a clean slate: logs and counters of an earlier run would
+        # block the profile delete or leak into this run's measurements
+        delete_students(cur)
+
+        buf = io.StringIO()
+        for i, sid in enumerate(ids):
+            buf.write(f"{sid}\tLoad Student {i}\t{LOADTEST_ROLE}\n")
+        buf.seek(0)
+        cur.copy_expert("COPY profiles (id, full_name, role) FROM STDIN", buf)
+
+        if initial_elo is not None:
+            cur.execute("SELECT id FROM concepts")
+            concept_ids = [r[0] for r in cur.fetchall()]
+            buf = io.StringIO()
+            for sid in ids:
+                for cid in concept_ids:
+                    buf.write(f"{sid}\t{cid}\t{initial_elo}\tf\t0\n")
+            buf.seek(0)
+            cur.copy_expert("COPY student_mastery (user_id, concept_id, current_elo, is_mastered, total_attempts) FROM STDIN", buf)
+
+        conn.commit()
+        if initial_elo is None:
+            print(f"✅ Provisioned {len(ids)} students (sparse mastery).")
+        else:
+            print(f"✅ Provisioned {len(ids)} students x {len(concept_ids)} concepts.")
+        return ids
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+
+def delete_students(cur):
+    sub = "SELECT id FROM profiles WHERE role = %s"
+    for table in STUDENT_TABLES:
+        cur.execute("SELECT to_regclass(%s)", (table,))
+        if cur.fetchone()[0] is not None:
+            cur.execute(f"DELETE FROM {table} WHERE user_id IN ({sub})", (LOADTEST_ROLE,))
+    cur.execute("DELETE FROM profiles WHERE role = %s", (LOADTEST_ROLE,))
+
+
+def cleanup_students():
+    conn = psycopg2.connect(DB_URL)
+    cur = conn.cursor()
+    try:
+        delete_students(cur)
+        conn.commit()
+        print("✅ Synthetic students removed.")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * p / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = {e: [] for e in ENDPOINTS}
+        self.errors = {e: 0 for e in ENDPOINTS}
+        self.pool_exhausted = 0
+        self.answers = 0
+
+    def record(self, endpoint, elapsed, response=None):
+        self.latencies[endpoint].append(elapsed)
+        if response is None or response.status_code >= 400:
+            self.errors[endpoint] += 1
+        # Pool exhaustion surfaces as 503 from the API's PoolTimeout handler
+        if response is not None and response.status_code == 503:
+            self.pool_exhausted += 1
+
+    def report(self, wall_time):
+        endpoints = {}
+        for e in ENDPOINTS:
+            lat = sorted(self.latencies[e])
+            if not lat:
+                continue
+            endpoints[e] = {
+                "requests": len(lat),
+                "errors": self.errors[e],
+                "error_rate": round(self.errors[e] / len(lat), 4),
+                "p50_ms": round(percentile(lat, 50) * 1000, 1),
+                "p95_ms": round(percentile(lat, 95) * 1000, 1),
+                "p99_ms": round(percentile(lat, 99) * 1000, 1),
+                "max_ms": round(lat[-1] * 1000, 1),
+            }
+        total = sum(len(v) for v in self.latencies.values())
+        return {
+            "wall_time_s": round(wall_time, 2),
+            "requests": total,
+            "throughput_rps": round(total / wall_time, 1) if wall_time > 0 else 0,
+            "answers": self.answers,
+            "answers_per_s": round(self.answers / wall_time, 1) if wall_time > 0 else 0,
+            "pool_exhaustion_events": self.pool_exhausted,
+            "endpoints": endpoints,
+        }
+
+
+async def timed(client, stats, endpoint, payload):
+    start = time.perf_counter()
+    try:
+        resp = await client.post(f"/{endpoint}", json=payload)
+    except httpx.HTTPError:
+        stats.record(endpoint, time.perf_counter() - start)
+        return None
+    stats.record(endpoint, time.perf_counter() - start, resp)
+    return resp.json() if resp.status_code < 400 else None
+
+
+def answer_correctly(ability, difficulty, rng):
+    # Same logistic Elo response model as the simulator
+    expected_p = 1 / (1 + 10 ** ((difficulty - ability) / 400))
+    return rng.random() < expected_p
+
+
+async def run_session(client, stats, sid, ability, answers, combined, rng, deadline):
+    question = None
+    for _ in range(answers):
+        if deadline and time.perf_counter() > deadline:
+            return
+        if question is None:
+            res = await timed(client, stats, "next-question", {"student_id": sid})
+            if not res or res.get("status") != "success":
+                return
+            question = res["data"]
+
+        payload = {
+            "student_id": sid,
+            "question_id": question["question_id"],
+            "is_correct": answer_correctly(ability, question["difficulty_elo"], rng),
+        }
+        if combined:
+            res = await timed(client, stats, "submit-and-next", payload)
+            if not res:
+                return
+            stats.answers += 1
+            nxt = res["next"]
+            question = nxt["data"] if nxt.get("status") == "success" else None
+            if question is None:
+                return
+        else:
+            res = await timed(client, stats, "submit-answer", payload)
+            if not res:
+                return
+            stats.answers += 1
+            question = None
+
+
+async def drive(args, ids):
+    stats = Stats()
+    rng = random.Random(args.seed)
+    abilities = {sid: rng.gauss(args.ability_mean, args.ability_sd) for sid in ids}
+    queue = asyncio.Queue()
+    for sid in ids:
+        queue.put_nowait(sid)
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    deadline = time.perf_counter() + args.duration if args.duration else None
+
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+        async def worker(n):
+            worker_rng = random.Random(f"{args.seed}-{n}")
+            while not queue.empty():
+                sid = queue.get_nowait()
+                await run_session(client, stats, sid, abilities[sid], args.answers,
+                                  args.combined, worker_rng, deadline)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(n) for n in range(args.concurrency)))
+        wall_time = time.perf_counter() - start
+
+    return stats.report(wall_time)
+
+
+def print_report(report):
+    print(f"\nWall time: {report['wall_time_s']} s | requests: {report['requests']} "
+          f"({report['throughput_rps']} req/s) | answers: {report['answers']} ({report['answers_per_s']}/s)")
+    print(f"Pool exhaustion events: {report['pool_exhaustion_events']}")
+    print(f"{'endpoint':<18}{'requests':>10}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, e in report["endpoints"].items():
+        print(f"{name:<18}{e['requests']:>10}{e['errors']:>8}{e['p50_ms']:>10}{e['p95_ms']:>10}{e['p99_ms']:>10}{e['max_ms']:>10}")
+
+
+def check_gates(report, args):
+    failures = []
+    for name, e in report["endpoints"].items():
+        if args.max_error_rate is not None and e["error_rate"] > args.max_error_rate:
+            failures.append(f"{name}: error rate {e['error_rate']} > {args.max_error_rate}")
+        if args.max_p95_ms is not None and e["p95_ms"] > args.max_p95_ms:
+            failures.append(f"{name}: p95 {e['p95_ms']} ms > {args.max_p95_ms} ms")
+    if args.max_pool_exhaustion is not None and report["pool_exhaustion_events"] > args.max_pool_exhaustion:
+        failures.append(f"pool exhaustion events {report['pool_exhaustion_events']} > {args.max_pool_exhaustion}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Provision synthetic students and load-test the engine endpoints.")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--students", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=100, help="Concurrent sessions")
+    parser.add_argument("--answers", type=int, default=20, help="Answers per student session")
+    parser.add_argument("--duration", type=float, default=None, help="Stop after this many seconds")
+    parser.add_argument("--combined", action="store_true", help="Use /submit-and-next instead of two calls")
+    parser.add_argument("--initial-elo", type=int, default=None,
+                        help="Materialize mastery rows at this ELO instead of starting at the server's DEFAULT_ELO")
+    parser.add_argument("--ability-mean", type=float, default=1000)
+    parser.add_argument("--ability-sd", type=float, default=150)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-provision", action="store_true", help="Reuse previously provisioned students")
+    parser.add_argument("--cleanup", action="store_true", help="Remove synthetic students and exit")
+    parser.add_argument("--json", help="Write the report to this file")
+    parser.add_argument("--max-error-rate", type=float, default=None)
+    parser.add_argument("--max-p95-ms", type=float, default=None)
+    parser.add_argument("--max-pool-exhaustion", type=int, default=None)
+    args = parser.parse_args()
+
+    if httpx is None:
+        print("Error: httpx is required (pip install httpx)")
+        return 2
+    if not DB_URL:
+        print("Error: DB_URL not found")
+        return 2
+
+    if args.cleanup:
+        cleanup_students()
+        return 0
+
+    ids = student_ids(args.students) if args.skip_provision else provision_students(args.students, args.initial_elo)
+
+    print(f"Driving {len(ids)} students with {args.concurrency} concurrent sessions...")
+    report = asyncio.run(drive(args, ids))
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    failures = check_gates(report, args)
+    for msg in failures:
+        print(f"❌ {msg}")
+    if not failures:
+        print("✅ Load test passed.")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,363 @@
+import os
+import re
+import time
+import argparse
+from datetime import datetime, timezone, date
+import psycopg2
+from psycopg2.extensions import quote_ident
+from dotenv import load_dotenv
+
+load_dotenv()
+DB_URL = os.environ.get("DB_URL")
+
+# learning_logs as monthly range partitions on created_at (UTC months).
+#   migrate   converts the plain table once, copying its rows into the new
+#             partitions under a lock that blocks writes but not reads, for
+#             the whole copy. Without LOG_WRITE_BEHIND every submit waits on
+#             the lock. With it, the flusher's COPY waits instead and submits
+#             continue until LOG_BUFFER_SIZE rows are queued; after that each
+#             submit waits LOG_ENQUEUE_TIMEOUT and its log row is dropped. The
+#             buffer only covers copies shorter than LOG_BUFFER_SIZE divided
+#             by the submit rate, so run it in a quiet window.
+#   maintain  pre-creates the coming months' partitions and applies retention:
+#             partitions older than --retain-months are detached, then rolled
+#             up into learning_log_monthly_summary. Run it daily from cron.
+# DETACH ... CONCURRENTLY is not allowed while a default partition exists, so
+# a plain DETACH is used. It needs an ACCESS EXCLUSIVE lock on learning_logs,
+# but only for a catalog change; it runs in its own transaction with
+# --lock-timeout so that it never queues in front of submits for long, and is
+# retried a few times when the lock is busy. learning_log_rollups records
+# which detached partitions were rolled up, so an interrupted run resumes
+# without counting a month twice.
+# Rows outside every monthly range land in learning_logs_default and are
+# moved into their month's partition when that partition is created.
+PARTITION_NAME = "learning_logs_p{:%Y%m}"
+PARTITION_PATTERN = re.compile(r"^learning_logs_p(\d{4})(\d{2})$")
+DEFAULT_PARTITION = "learning_logs_default"
+DETACH_ATTEMPTS = 5
+
+SUMMARY_SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS learning_log_monthly_summary (
+        user_id uuid NOT NULL,
+        month date NOT NULL,
+        concept_id text NOT NULL,
+        answers integer NOT NULL DEFAULT 0,
+        correct_answers integer NOT NULL DEFAULT 0,
+        elo_change bigint NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, month, concept_id)
+    );
+    CREATE TABLE IF NOT EXISTS learning_log_rollups (
+        partition text PRIMARY KEY,
+        month date NOT NULL,
+        rolled_up_at timestamptz NOT NULL DEFAULT now()
+    );
+"""
+
+ROLLUP_SQL = """
+    INSERT INTO learning_log_monthly_summary AS s (user_id, month, concept_id, answers, correct_answers, elo_change)
+    SELECT user_id, %(month)s, concept_id, count(*), count(*) FILTER (WHERE is_correct), coalesce(sum(elo_change), 0)
+    FROM {partition}
+    GROUP BY user_id, concept_id
+    ON CONFLICT (user_id, month, concept_id) DO UPDATE
+    SET answers = s.answers + EXCLUDED.answers,
+        correct_answers = s.correct_answers + EXCLUDED.correct_answers,
+        elo_change = s.elo_change + EXCLUDED.elo_change
+"""
+
+def add_months(month, n):
+    year, index = divmod(month.year * 12 + month.month - 1 + n, 12)
+    return date(year, index + 1, 1)
+
+def current_month():
+    return datetime.now(timezone.utc).date().replace(day=1)
+
+def month_bound(month):
+    return f"'{month.isoformat()} 00:00:00+00'"
+
+def relkind(cur, name):
+    cur.execute("SELECT c.relkind FROM pg_class c WHERE c.oid = to_regclass(%s)", (name,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+def ensure_partition(cur, parent, month):
+    """Create and attach the partition for month unless it exists. Rows for
+    that month already sitting in the default partition are moved into it."""
+    name = PARTITION_NAME.format(month)
+    if relkind(cur, name):
+        return False
+    lower, upper = month_bound(month), month_bound(add_months(month, 1))
+    cur.execute(f"CREATE TABLE {name} (LIKE {parent} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    # Until the attach commits, a row for this month routed to the default
+    # partition would make the attach fail; inserts into it wait instead
+    cur.execute(f"LOCK TABLE {DEFAULT_PARTITION} IN EXCLUSIVE MODE")
+    cur.execute(f"""
+        WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION}
+            WHERE created_at >= {lower} AND created_at < {upper}
+            RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    """)
+    if cur.rowcount:
+        print(f"  moved {cur.rowcount} rows from {DEFAULT_PARTITION}")
+    cur.execute(f"ALTER TABLE {parent} ATTACH PARTITION {name} FOR VALUES FROM ({lower}) TO ({upper})")
+    return True
+
+def monthly_partitions(cur):
+    cur.execute("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'learning_logs'::regclass
+    """)
+    partitions = []
+    for (name,) in cur.fetchall():
+        m = PARTITION_PATTERN.match(name)
+        if m:
+            partitions.append((date(int(m.group(1)), int(m.group(2)), 1), name))
+    return sorted(partitions)
+
+def detached_partitions(cur):
+    # Monthly tables no longer attached to learning_logs and not rolled up yet
+    cur.execute("""
+        SELECT c.relname FROM pg_class c
+        WHERE c.relnamespace = current_schema()::regnamespace AND c.relkind = 'r'
+          AND c.relname ~ '^learning_logs_p[0-9]{6}$'
+          AND NOT EXISTS (SELECT 1 FROM pg_inherits i WHERE i.inhrelid = c.oid)
+          AND NOT EXISTS (SELECT 1 FROM learning_log_rollups r WHERE r.partition = c.relname)
+    """)
+    partitions = []
+    for (name,) in cur.fetchall():
+        m = PARTITION_PATTERN.match(name)
+        partitions.append((date(int(m.group(1)), int(m.group(2)), 1), name))
+    return sorted(partitions)
+
+def detach_partition(conn, cur, name, lock_timeout):
+    for attempt in range(1, DETACH_ATTEMPTS + 1):
+        try:
+            cur.execute("SELECT set_config('lock_timeout', %s, true)", (f"{int(lock_timeout * 1000)}ms",))
+            cur.execute(f"ALTER TABLE learning_logs DETACH PARTITION {name}")
+            conn.commit()
+            return True
+        except psycopg2.errors.LockNotAvailable:
+            conn.rollback()
+            print(f"  learning_logs is busy, detach attempt {attempt}/{DETACH_ATTEMPTS} timed out")
+            time.sleep(attempt)
+    return False
+
+def foreign_keys(cur, table):
+    cur.execute("""
+        SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = %s::regclass AND contype = 'f'
+        ORDER BY conname
+    """, (table,))
+    return cur.fetchall()
+
+def unsupported_dependencies(cur, table):
+    # LIKE does not carry these over, and they cannot be recreated as is:
+    # foreign keys pointing at the table need a unique key on id alone, the
+    # partitioned table's key is (id, created_at)
+    problems = []
+    cur.execute("""
+        SELECT conname, conrelid::regclass::text FROM pg_constraint
+        WHERE confrelid = %s::regclass AND contype = 'f'
+    """, (table,))
+    problems += [f"foreign key {name} on {other} references {table}" for name, other in cur.fetchall()]
+    cur.execute("SELECT tgname FROM pg_trigger WHERE tgrelid = %s::regclass AND NOT tgisinternal", (table,))
+    problems += [f"trigger {name}" for (name,) in cur.fetchall()]
+    return problems
+
+def copy_indexes(cur, source, target):
+    # Non-unique indexes carry over; unique ones cannot, as they would have
+    # to include created_at. Names are generated for the new table.
+    cur.execute("""
+        SELECT indexdef FROM pg_indexes
+        WHERE schemaname = current_schema() AND tablename = %s AND indexdef NOT LIKE 'CREATE UNIQUE%%'
+    """, (source,))
+    definitions = [r[0] for r in cur.fetchall()]
+    if not any("(user_id, created_at" in d for d in definitions):
+        definitions.append(f"CREATE INDEX x ON {source} USING btree (user_id, created_at)")
+    for d in definitions:
+        cur.execute(re.sub(r"^CREATE INDEX \S+ ON (\S+\.)?" + source + " ", f"CREATE INDEX ON {target} ", d))
+    return len(definitions)
+
+def migrate(months_ahead, drop_old):
+    if not DB_URL:
+        print("Error: DB_URL not found")
+        return False
+
+    print("Connecting to DB...")
+    conn = psycopg2.connect(DB_URL)
+    cur = conn.cursor()
+    start = time.perf_counter()
+    try:
+        kind = relkind(cur, "learning_logs")
+        if kind == "p":
+            print("✅ learning_logs is already partitioned.")
+            return True
+        if kind != "r":
+            print("❌ learning_logs not found.")
+            return False
+
+        print("Locking learning_logs against writes...")
+        cur.execute("LOCK TABLE learning_logs IN EXCLUSIVE MODE")
+        cur.execute("SELECT count(*) FROM learning_logs WHERE created_at IS NULL")
+        missing = cur.fetchone()[0]
+        if missing:
+            print(f"❌ {missing} rows have no created_at; set it before partitioning.")
+            conn.rollback()
+            return False
+        problems = unsupported_dependencies(cur, "learning_logs")
+        if problems:
+            for problem in problems:
+                print(f"❌ Cannot carry over {problem}; remove it before partitioning and recreate it afterwards.")
+            conn.rollback()
+            return False
+
+        cur.execute("""
+            CREATE TABLE learning_logs_partitioned (LIKE learning_logs INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+            PARTITION BY RANGE (created_at)
+        """)
+        cur.execute("ALTER TABLE learning_logs_partitioned ALTER COLUMN created_at SET NOT NULL")
+        cur.execute("ALTER TABLE learning_logs_partitioned ADD PRIMARY KEY (id, created_at)")
+        print(f"Created partitioned table with {copy_indexes(cur, 'learning_logs', 'learning_logs_partitioned')} indexes")
+        cur.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF learning_logs_partitioned DEFAULT")
+
+        cur.execute("SELECT DISTINCT date_trunc('month', created_at AT TIME ZONE 'UTC')::date FROM learning_logs")
+        months = {r[0] for r in cur.fetchall()}
+        months.update(add_months(current_month(), i) for i in range(months_ahead + 1))
+        for month in sorted(months):
+            ensure_partition(cur, "learning_logs_partitioned", month)
+        print(f"Created {len(months)} monthly partitions")
+
+        print("Copying rows...")
+        cur.execute("INSERT INTO learning_logs_partitioned SELECT * FROM learning_logs")
+        print(f"  {cur.rowcount} rows")
+
+        # LIKE leaves out foreign keys; added after the copy, each is checked in one pass
+        for name, definition in foreign_keys(cur, "learning_logs"):
+            if definition.endswith(" NOT VALID"):
+                # Not supported on partitioned tables; existing rows must pass
+                definition = definition[:-len(" NOT VALID")]
+                print(f"  {name} was NOT VALID and is validated now")
+            cur.execute(f"ALTER TABLE learning_logs_partitioned ADD CONSTRAINT {quote_ident(name, cur)} {definition}")
+            print(f"Added foreign key {name}: {definition}")
+
+        cur.execute("ALTER TABLE learning_logs RENAME TO learning_logs_unpartitioned")
+        cur.execute("ALTER TABLE learning_logs_partitioned RENAME TO learning_logs")
+        # The id sequence would otherwise be dropped with the old table
+        cur.execute("SELECT pg_get_serial_sequence('learning_logs_unpartitioned', 'id')")
+        sequence = cur.fetchone()[0]
+        if sequence:
+            cur.execute(f"ALTER SEQUENCE {sequence} OWNED BY learning_logs.id")
+        if drop_old:
+            cur.execute("DROP TABLE learning_logs_unpartitioned")
+        cur.execute(SUMMARY_SCHEMA_SQL)
+        conn.commit()
+
+        cur.execute("ANALYZE learning_logs")
+        conn.commit()
+        print(f"✅ learning_logs partitioned in {time.perf_counter() - start:.1f}s.")
+        if not drop_old:
+            print("The original table is kept as learning_logs_unpartitioned; drop it once verified.")
+        return True
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Error partitioning learning_logs: {e}")
+        return False
+    finally:
+        cur.close()
+        conn.close()
+
+def maintain(months_ahead, retain_months, drop_detached, lock_timeout, dry_run=False):
+    if not DB_URL:
+        print("Error: DB_URL not found")
+        return False
+
+    print("Connecting to DB...")
+    conn = psycopg2.connect(DB_URL)
+    cur = conn.cursor()
+    try:
+        if relkind(cur, "learning_logs") != "p":
+            print("❌ learning_logs is not partitioned; run the migrate command first.")
+            return False
+        first_run = relkind(cur, "learning_log_rollups") is None
+        cur.execute(SUMMARY_SCHEMA_SQL)
+        if first_run:
+            # Earlier versions rolled partitions up before detaching them
+            for month, name in detached_partitions(cur):
+                cur.execute("INSERT INTO learning_log_rollups (partition, month) VALUES (%s, %s)", (name, month))
+        conn.commit()
+
+        this_month = current_month()
+        for i in range(months_ahead + 1):
+            month = add_months(this_month, i)
+            if dry_run:
+                if not relkind(cur, PARTITION_NAME.format(month)):
+                    print(f"Would create {PARTITION_NAME.format(month)}")
+                continue
+            if ensure_partition(cur, "learning_logs", month):
+                conn.commit()
+                print(f"Created {PARTITION_NAME.format(month)}")
+
+        if retain_months is not None:
+            cutoff = add_months(this_month, -retain_months)
+            for month, name in monthly_partitions(cur):
+                if month >= cutoff:
+                    break
+                if dry_run:
+                    print(f"Would detach and roll up {name}")
+                    continue
+                # Rows for the month arriving later land in the default partition
+                if not detach_partition(conn, cur, name, lock_timeout):
+                    print(f"❌ Could not detach {name}; try again later.")
+                    return False
+                print(f"Detached {name}")
+
+            for month, name in detached_partitions(cur):
+                if month >= cutoff or dry_run:
+                    continue
+                cur.execute(ROLLUP_SQL.format(partition=name), {"month": month})
+                summary_rows = cur.rowcount
+                cur.execute("INSERT INTO learning_log_rollups (partition, month) VALUES (%s, %s)", (name, month))
+                if drop_detached:
+                    cur.execute(f"DROP TABLE {name}")
+                conn.commit()
+                print(f"Rolled up {name} into {summary_rows} summary rows{' and dropped it' if drop_detached else ''}")
+
+        cur.execute(f"SELECT count(*) FROM {DEFAULT_PARTITION}")
+        stray = cur.fetchone()[0]
+        if stray:
+            print(f"Warning: {stray} rows in {DEFAULT_PARTITION} fall outside the monthly partitions")
+        conn.rollback()
+        print("✅ Partition maintenance finished.")
+        return True
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Error maintaining learning_logs partitions: {e}")
+        return False
+    finally:
+        cur.close()
+        conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Partition learning_logs by month and manage its partitions.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("migrate", help="Convert learning_logs into a partitioned table")
+    p.add_argument("--months-ahead", type=int, default=3, help="Future monthly partitions to create")
+    p.add_argument("--drop-old", action="store_true", help="Drop the original table instead of keeping it renamed")
+
+    p = sub.add_parser("maintain", help="Create upcoming partitions and apply retention")
+    p.add_argument("--months-ahead", type=int, default=3, help="Future monthly partitions to keep created")
+    p.add_argument("--retain-months", type=int, default=None,
+                   help="Roll up and detach partitions older than this many months (default: keep all)")
+    p.add_argument("--drop-detached", action="store_true", help="Drop partitions after rolling them up")
+    p.add_argument("--lock-timeout", type=float, default=2.0,
+                   help="Seconds a detach may wait for its lock on learning_logs before retrying")
+    p.add_argument("--dry-run", action="store_true", help="Only report what would change")
+
+    args = parser.parse_args()
+    if args.command == "migrate":
+        ok = migrate(args.months_ahead, args.drop_old)
+    else:
+        ok = maintain(args.months_ahead, args.retain_months, args.drop_detached, args.lock_timeout, args.dry_run)
+    raise SystemExit(0 if ok else 1)
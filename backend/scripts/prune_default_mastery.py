@@ -0,0 +1,86 @@
+import os
+import time
+import argparse
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv()
+DB_URL = os.environ.get("DB_URL")
+DEFAULT_ELO = int(os.environ.get("DEFAULT_ELO", 1000))
+
+# student_mastery is sparse: a concept without a row counts at DEFAULT_ELO
+# and submit_answer creates the row on the first answer. Rows that were
+# pre-seeded for every enrolled student and never answered carry no
+# information, so they can be deleted. Submits running at the same time are
+# safe: a row answered meanwhile no longer matches and is kept, and a row
+# deleted first is re-created by the answer.
+PRUNE_SQL = """
+    DELETE FROM student_mastery
+    WHERE ctid = ANY(ARRAY(
+        SELECT ctid FROM student_mastery
+        WHERE coalesce(total_attempts, 0) = 0
+          AND current_elo = %(default_elo)s
+          AND NOT coalesce(is_mastered, false)
+        LIMIT %(batch_size)s
+    ))
+"""
+
+COUNT_SQL = """
+    SELECT count(*) AS total,
+           count(*) FILTER (WHERE coalesce(total_attempts, 0) = 0
+                              AND current_elo = %(default_elo)s
+                              AND NOT coalesce(is_mastered, false)) AS prunable
+    FROM student_mastery
+"""
+
+def prune_default_mastery(default_elo, batch_size, dry_run=False, vacuum=False):
+    if not DB_URL:
+        print("Error: DB_URL not found")
+        return False
+
+    print("Connecting to DB...")
+    conn = psycopg2.connect(DB_URL)
+    cur = conn.cursor()
+    params = {"default_elo": default_elo, "batch_size": batch_size}
+    try:
+        cur.execute(COUNT_SQL, params)
+        total, prunable = cur.fetchone()
+        print(f"{prunable} of {total} mastery rows are unanswered at ELO {default_elo}")
+        if dry_run or not prunable:
+            conn.rollback()
+            return True
+
+        # Short batches keep row locks and WAL bursts small on a live table
+        start = time.perf_counter()
+        deleted = 0
+        while True:
+            cur.execute(PRUNE_SQL, params)
+            conn.commit()
+            if cur.rowcount == 0:
+                break
+            deleted += cur.rowcount
+            print(f"  deleted {deleted}/{prunable}")
+        print(f"✅ Pruned {deleted} rows in {time.perf_counter() - start:.1f}s.")
+
+        if vacuum:
+            print("Vacuuming student_mastery...")
+            conn.autocommit = True
+            cur.execute("VACUUM (ANALYZE) student_mastery")
+            print("✅ Vacuumed. Run REINDEX TABLE CONCURRENTLY student_mastery to shrink its indexes.")
+        return True
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Error pruning mastery rows: {e}")
+        return False
+    finally:
+        cur.close()
+        conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delete student_mastery rows that were never answered and sit at the default ELO.")
+    parser.add_argument("--default-elo", type=int, default=DEFAULT_ELO, help="Must match the API's DEFAULT_ELO")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--dry-run", action="store_true", help="Only count prunable rows")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM (ANALYZE) the table afterwards")
+    args = parser.parse_args()
+    raise SystemExit(0 if prune_default_mastery(args.default_elo, args.batch_size, args.dry_run, args.vacuum) else 1)
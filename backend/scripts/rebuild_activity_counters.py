@@ -0,0 +1,106 @@
+import os
+import argparse
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv()
+DB_URL = os.environ.get("DB_URL")
+ACTIVITY_TIMEZONE = os.environ.get("ACTIVITY_TIMEZONE")
+
+# Per-student activity counters maintained by submit_answer.
+# Running this script creates them if needed and rebuilds them from learning_logs,
+# plus learning_log_monthly_summary for months whose partitions were rolled up
+# by partition_learning_logs.py (daily counters only cover retained months).
+# With LOG_WRITE_BEHIND enabled, run it once the log buffer is drained,
+# otherwise rows still in the buffer are missing from the rebuilt counts.
+COUNTERS_SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS student_activity_counters (
+        user_id uuid PRIMARY KEY,
+        total_answers bigint NOT NULL DEFAULT 0,
+        correct_answers bigint NOT NULL DEFAULT 0,
+        elo_growth bigint NOT NULL DEFAULT 0,
+        updated_at timestamptz NOT NULL DEFAULT now()
+    );
+
+    ALTER TABLE student_activity_counters ADD COLUMN IF NOT EXISTS elo_growth bigint NOT NULL DEFAULT 0;
+
+    CREATE TABLE IF NOT EXISTS student_daily_activity (
+        user_id uuid NOT NULL,
+        activity_date date NOT NULL,
+        answers integer NOT NULL DEFAULT 0,
+        correct_answers integer NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, activity_date)
+    );
+"""
+
+def rebuild_activity_counters(user_id=None):
+    if not DB_URL:
+        print("Error: DB_URL not found")
+        return
+
+    print("Connecting to DB...")
+    conn = psycopg2.connect(DB_URL)
+    cur = conn.cursor()
+
+    try:
+        cur.execute(COUNTERS_SCHEMA_SQL)
+        if ACTIVITY_TIMEZONE:
+            # Count days in the same time zone as the API
+            cur.execute("SELECT set_config('TimeZone', %s, false)", (ACTIVITY_TIMEZONE,))
+        # Block concurrent counter updates so none are lost during the rebuild
+        cur.execute("LOCK TABLE student_activity_counters, student_daily_activity IN EXCLUSIVE MODE")
+
+        where = "WHERE user_id = %(user_id)s" if user_id else ""
+        params = {"user_id": user_id}
+
+        cur.execute("SELECT to_regclass('learning_log_monthly_summary') IS NOT NULL")
+        rolled_up = ""
+        if cur.fetchone()[0]:
+            rolled_up = f"""
+                UNION ALL
+                SELECT user_id, SUM(answers), SUM(correct_answers), SUM(elo_change)
+                FROM learning_log_monthly_summary
+                {where}
+                GROUP BY user_id"""
+
+        print("Rebuilding total counters...")
+        cur.execute(f"DELETE FROM student_activity_counters {where}", params)
+        cur.execute(f"""
+            INSERT INTO student_activity_counters (user_id, total_answers, correct_answers, elo_growth)
+            SELECT user_id, SUM(answers), SUM(correct_answers), SUM(elo_growth)
+            FROM (
+                SELECT user_id, COUNT(*) AS answers, COUNT(*) FILTER (WHERE is_correct) AS correct_answers,
+                       coalesce(SUM(elo_change), 0) AS elo_growth
+                FROM learning_logs
+                {where}
+                GROUP BY user_id{rolled_up}
+            ) t
+            GROUP BY user_id
+        """, params)
+        print(f"  {cur.rowcount} students")
+
+        print("Rebuilding daily counters...")
+        cur.execute(f"DELETE FROM student_daily_activity {where}", params)
+        cur.execute(f"""
+            INSERT INTO student_daily_activity (user_id, activity_date, answers, correct_answers)
+            SELECT user_id, created_at::date, COUNT(*), COUNT(*) FILTER (WHERE is_correct)
+            FROM learning_logs
+            {where}
+            GROUP BY user_id, created_at::date
+        """, params)
+        print(f"  {cur.rowcount} student-days")
+
+        conn.commit()
+        print("✅ Activity counters rebuilt.")
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Error rebuilding activity counters: {e}")
+    finally:
+        cur.close()
+        conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create and rebuild per-student activity counters from learning_logs.")
+    parser.add_argument("--user-id", help="Only repair the counters of this student")
+    args = parser.parse_args()
+    rebuild_activity_counters(args.user_id)
@@ -12,7 +12,9 @@ BLOCK 0 — Nhập thư viện
 import pandas as pd
 import numpy as np
 import networkx as nx
-import time
+import os
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 from math import *
 
 """BLOCK 1 — Tải dữ liệu (nodes, edges, question_bank, profiles)"""
@@ -55,8 +57,7 @@ student_profiles.head()
 
 def build_graph_from_edges(edges_df):
     G = nx.DiGraph()
-    for _, row in edges_df.iterrows():
-        G.add_edge(row['source'], row['target'])
+    G.add_edges_from(zip(edges_df['source'], edges_df['target']))
     return G
 
 concept_graph = build_graph_from_edges(edges_adv_df)
@@ -75,129 +76,224 @@ def get_k_factor(questions_answered, k_mode="dynamic", base_k=24):
     else:
         return 16
 
+def derive_seed(*parts):
+    """Seed xác định từ các tham số (không dùng hash() vì bị salt theo tiến trình)."""
+    digest = hashlib.sha256("|".join(map(str, parts)).encode("utf-8")).digest()
+    return int.from_bytes(digest[:4], "little")
+
 """BLOCK 4 — Ánh xạ khái niệm sang chương & xác định cạnh liên chương"""
 
 CONCEPT_TO_CHAPTER = dict(zip(concept_map_df['concept_id'], concept_map_df['chapter']))
 
 def build_cross_chapter_info(edges_df, concept_to_chapter):
-    cross_edges = set()
-    successors = {}
+    src, dst = edges_df['source'], edges_df['target']
+    cu, cv = src.map(concept_to_chapter), dst.map(concept_to_chapter)
+    is_cross = cu.notna() & cv.notna() & (cu != cv)
+    cross_edges = set(zip(src[is_cross], dst[is_cross]))
 
-    for _, row in edges_df.iterrows():
-        u, v = row['source'], row['target']
-        cu, cv = concept_to_chapter.get(u), concept_to_chapter.get(v)
-        if cu and cv and cu != cv:
-            cross_edges.add((u,v))
-        successors.setdefault(u, set()).add(v)
+    successors = {u: set(g) for u, g in dst.groupby(src, sort=False)}
 
     return cross_edges, successors
 
 CROSS_EDGES_ADV, SUCCESSORS_ADV = build_cross_chapter_info(edges_adv_df, CONCEPT_TO_CHAPTER)
 CROSS_EDGES_BASE, SUCCESSORS_BASE = build_cross_chapter_info(edges_base_df, CONCEPT_TO_CHAPTER)
 
-"""BLOCK 5 —  Thuật toán chọn câu hỏi thích ứng"""
+"""BLOCK 5 —  Thuật toán chọn câu hỏi thích ứng
 
-def select_adaptive_question(
-    student_id,
-    student_profiles_df,
-    question_bank_df,
-    graph,
-    concept_to_chapter,
+Lõi mô phỏng dùng mảng: mỗi concept được ánh xạ sang một chỉ số nguyên,
+ELO của học sinh nằm trong một mảng NumPy. Các hàm nhận DataFrame bên dưới
+chỉ là lớp bọc mỏng quanh lõi này.
+"""
+
+# Cấu trúc tính sẵn một lần cho mỗi (đồ thị, ngân hàng câu hỏi, tập cạnh liên chương)
+_SIMULATION_INDEX_CACHE = {}
+
+def build_simulation_index(graph, question_bank_df, cross_edges=None):
+    if cross_edges is None:
+        cross_edges = set()
+
+    nodes = list(graph.nodes())
+    node_idx = {n: i for i, n in enumerate(nodes)}
+
+    # tiên quyết dạng mảng chỉ số: cạnh k đi từ pre_src[k] tới pre_owner[k]
+    edges = [(node_idx[u], node_idx[v]) for u, v in graph.edges()]
+    pre_src = np.array([u for u, _ in edges], dtype=np.int64)
+    pre_owner = np.array([v for _, v in edges], dtype=np.int64)
+    is_cross = np.array([(nodes[u], nodes[v]) in cross_edges for u, v in edges], dtype=bool)
+
+    # câu hỏi theo concept, sắp theo elo_difficulty (stable: giữ thứ tự gốc khi bằng nhau)
+    questions = [None] * len(nodes)
+    qb = question_bank_df[question_bank_df['concept_id'].isin(node_idx)]
+    qb = qb.sort_values('elo_difficulty', kind='stable')
+    for cid, g in qb.groupby('concept_id', sort=False):
+        questions[node_idx[cid]] = (
+            g.index.to_numpy(),
+            g['question_id'].to_numpy(),
+            g['elo_difficulty'].to_numpy(dtype=float),
+            question_bank_df.index.get_indexer(g.index),
+        )
+
+    return {
+        "nodes": nodes,
+        "node_idx": node_idx,
+        "pre_src": pre_src,
+        "pre_owner": pre_owner,
+        "cross_src": pre_src[is_cross],
+        "cross_owner": pre_owner[is_cross],
+        "questions": questions,
+    }
+
+def get_simulation_index(graph, question_bank_df, cross_edges=None):
+    key = (id(graph), id(question_bank_df), id(cross_edges))
+    cached = _SIMULATION_INDEX_CACHE.get(key)
+    if cached is None or cached[0] is not graph or cached[1] is not question_bank_df or cached[2] is not cross_edges:
+        cached = (graph, question_bank_df, cross_edges,
+                  build_simulation_index(graph, question_bank_df, cross_edges))
+        _SIMULATION_INDEX_CACHE[key] = cached
+    return cached[3]
+
+def build_simulation_core(graph, student_profiles_df, question_bank_df, cross_edges=None):
+    index = get_simulation_index(graph, question_bank_df, cross_edges)
+    elo_cols = [f'elo_{n}' for n in index["nodes"]]
+    has_elo = np.array([c in student_profiles_df.columns for c in elo_cols], dtype=bool)
+    return {**index, "elo_cols": elo_cols, "has_elo": has_elo}
+
+def load_student_elos(core, student_profiles_df, student_id):
+    row = student_profiles_df.loc[student_id]
+    return np.array([
+        float(row[c]) if h else np.nan
+        for c, h in zip(core["elo_cols"], core["has_elo"])
+    ])
+
+def store_student_elos(core, student_profiles_df, student_id, elos):
+    has_elo = core["has_elo"]
+    cols = [c for c, h in zip(core["elo_cols"], has_elo) if h]
+    student_profiles_df[cols] = student_profiles_df[cols].astype(float)
+    student_profiles_df.loc[student_id, cols] = elos[has_elo]
+
+def nearest_question(qs, s_elo):
+    """Vị trí câu hỏi có độ khó gần s_elo nhất (bằng nhau: câu đứng trước trong ngân hàng)."""
+    d = qs[2]
+    i = int(np.searchsorted(d, s_elo))
+    best = None
+    for j in (i - 1, i):
+        if 0 <= j < len(d):
+            j = int(np.searchsorted(d, d[j]))  # phần tử đầu của nhóm cùng độ khó
+            key = (abs(d[j] - s_elo), qs[3][j])
+            if best is None or key < best[0]:
+                best = (key, j)
+    return best[1]
+
+def select_adaptive_question_core(
+    core,
+    elos,
     mastery_threshold=1300.0,
     selection_strategy="lowest_elo",
-    prev_ready_nodes=None,
-    cross_edges=None,
+    prev_ready=None,
 ):
-    if cross_edges is None:
-        cross_edges = set()
+    """Trả về (chỉ số concept, vị trí câu hỏi) hoặc (None, None) / ("RETRY", None).
 
-    student_elos = student_profiles_df.loc[student_id]
+    prev_ready và extra["ready_mask"] là mặt nạ bool theo chỉ số concept.
+    """
+    n = len(core["nodes"])
+    has_elo = core["has_elo"]
 
     # === READY NODES ===
-    ready_nodes = []
-    for node in graph.nodes():
-        elo_col = f'elo_{node}'
-        if elo_col not in student_elos:
-            continue
-        if pd.isna(student_elos[elo_col]):
-            continue
-        if student_elos[elo_col] >= mastery_threshold:
-            continue
-
-        prereqs = list(graph.predecessors(node))
-        if not prereqs:
-            ready_nodes.append(node)
-        else:
-            if all(student_elos[f'elo_{p}'] >= mastery_threshold for p in prereqs):
-                ready_nodes.append(node)
+    mastered = elos >= mastery_threshold
+    unmet = np.bincount(core["pre_owner"][~mastered[core["pre_src"]]], minlength=n)
+    ready_mask = has_elo & ~np.isnan(elos) & ~mastered & (unmet == 0)
 
     # fallback
-    if not ready_nodes:
-        unmastered = [n for n in graph.nodes()
-                      if student_elos.get(f'elo_{n}', -1e9) < mastery_threshold]
-        if not unmastered:
-            return None, {
+    if not ready_mask.any():
+        ready_mask = ~has_elo | (elos < mastery_threshold)
+        if not ready_mask.any():
+            return None, None, {
                 "ready_set_size": 0,
                 "newly_unlocked_size": 0,
                 "selection_reason": "all_mastered",
                 "target_concept": None
             }
-        ready_nodes = unmastered
 
-    ready_set_size = len(ready_nodes)
-    if prev_ready_nodes is None:
-        prev_ready_nodes = set()
-    newly_unlocked = set(ready_nodes) - set(prev_ready_nodes)
-    newly_unlocked_size = len(newly_unlocked)
+    ready = np.flatnonzero(ready_mask)
+    if prev_ready is None:
+        prev_ready = np.zeros(n, dtype=bool)
+    newly_unlocked = ready_mask & ~prev_ready
+
+    def lowest(candidates):
+        return int(candidates[np.argmin(elos[candidates])])
 
     # === STRATEGY ===
     if selection_strategy == "lowest_elo":
-        target_concept = min(ready_nodes, key=lambda n: student_elos[f'elo_{n}'])
+        target = lowest(ready)
         selection_reason = "lowest_elo"
 
     elif selection_strategy == "cross_chapter_unlock":
-        cc_candidates = []
-        for node in newly_unlocked:
-            prereqs = list(graph.predecessors(node))
-            for p in prereqs:
-                if (p, node) in cross_edges and student_elos[f'elo_{p}'] >= mastery_threshold:
-                    cc_candidates.append(node)
-                    break
-
-        if cc_candidates:
-            target_concept = min(cc_candidates, key=lambda n: student_elos[f'elo_{n}'])
+        cross_src, cross_owner = core["cross_src"], core["cross_owner"]
+        hit = newly_unlocked[cross_owner] & mastered[cross_src]
+        cc_candidates = np.unique(cross_owner[hit])
+
+        if len(cc_candidates):
+            target = lowest(cc_candidates)
             selection_reason = "new_cross_chapter"
         else:
-            target_concept = min(ready_nodes, key=lambda n: student_elos[f'elo_{n}'])
+            target = lowest(ready)
             selection_reason = "lowest_elo_fallback"
 
     else:
-        target_concept = min(ready_nodes, key=lambda n: student_elos[f'elo_{n}'])
+        target = lowest(ready)
         selection_reason = f"fallback_{selection_strategy}"
 
-    # === LẤY CÂU HỎI ===
-    qs = question_bank_df[question_bank_df['concept_id'] == target_concept]
-    if qs.empty:
-        return "RETRY", {
-            "ready_set_size": ready_set_size,
-            "newly_unlocked_size": newly_unlocked_size,
-            "selection_reason": "no_question",
-            "target_concept": target_concept
-        }
-
-    s_elo = student_elos[f'elo_{target_concept}']
-    diff = (qs['elo_difficulty'] - s_elo).abs()
-    best_idx = diff.idxmin()
-    chosen = qs.loc[best_idx]
-
-    return chosen, {
-        "ready_set_size": ready_set_size,
-        "newly_unlocked_size": newly_unlocked_size,
+    extra = {
+        "ready_set_size": len(ready),
+        "newly_unlocked_size": int(newly_unlocked.sum()),
         "selection_reason": selection_reason,
-        "target_concept": target_concept,
-        "ready_nodes": ready_nodes,
+        "target_concept": core["nodes"][target],
+        "ready_mask": ready_mask,
     }
 
+    # === LẤY CÂU HỎI ===
+    qs = core["questions"][target]
+    if qs is None:
+        extra["selection_reason"] = "no_question"
+        return "RETRY", None, extra
+
+    return target, nearest_question(qs, elos[target]), extra
+
+def select_adaptive_question(
+    student_id,
+    student_profiles_df,
+    question_bank_df,
+    graph,
+    concept_to_chapter,
+    mastery_threshold=1300.0,
+    selection_strategy="lowest_elo",
+    prev_ready_nodes=None,
+    cross_edges=None,
+):
+    core = build_simulation_core(graph, student_profiles_df, question_bank_df, cross_edges)
+    elos = load_student_elos(core, student_profiles_df, student_id)
+    prev_ready = None
+    if prev_ready_nodes is not None:
+        prev_ready = np.zeros(len(core["nodes"]), dtype=bool)
+        prev_ready[[core["node_idx"][n] for n in prev_ready_nodes if n in core["node_idx"]]] = True
+
+    target, q_pos, extra = select_adaptive_question_core(
+        core, elos,
+        mastery_threshold=mastery_threshold,
+        selection_strategy=selection_strategy,
+        prev_ready=prev_ready,
+    )
+    ready_mask = extra.pop("ready_mask", None)
+
+    if target is None:
+        return None, extra
+    if isinstance(target, str):
+        return "RETRY", extra
+
+    extra["ready_nodes"] = [core["nodes"][i] for i in np.flatnonzero(ready_mask)]
+    chosen = question_bank_df.loc[core["questions"][target][0][q_pos]]
+    return chosen, extra
+
 """BLOCK 6 — Chạy mô phỏng thích ứng cho một học sinh"""
 
 def run_adaptive_simulation(
@@ -212,34 +308,36 @@ def run_adaptive_simulation(
     base_k=24,
     selection_strategy="lowest_elo",
     cross_edges=None,
-    engine_type="Advanced"
+    engine_type="Advanced",
+    seed=None
 ):
     print(f"\n--- Running {student_id} ({engine_type}) ---")
 
     student_profiles = student_profiles_df.copy()
     logs = []
-    np.random.seed((int(time.time()) + hash(student_id)) % (2**32))
+    if seed is None:
+        seed = derive_seed(student_id, engine_type, mastery_threshold, k_mode, base_k, selection_strategy)
+    rng = np.random.default_rng(seed)
+
+    core = build_simulation_core(graph, student_profiles, question_bank_df, cross_edges)
+    nodes = core["nodes"]
+    elos = load_student_elos(core, student_profiles, student_id)
 
     # đếm số câu đã hỏi trên từng concept để tính K
-    concept_counts = {node: 0 for node in graph.nodes()}
-    prev_ready_nodes = None
+    concept_counts = np.zeros(len(nodes), dtype=np.int64)
+    prev_ready = None
     prev_chapter = None
 
     for step in range(1, num_questions+1):
-        chosen, extra = select_adaptive_question(
-            student_id=student_id,
-            student_profiles_df=student_profiles,
-            question_bank_df=question_bank_df,
-            graph=graph,
-            concept_to_chapter=concept_to_chapter,
+        target, q_pos, extra = select_adaptive_question_core(
+            core, elos,
             mastery_threshold=mastery_threshold,
             selection_strategy=selection_strategy,
-            prev_ready_nodes=prev_ready_nodes,
-            cross_edges=cross_edges,
+            prev_ready=prev_ready,
         )
 
         # case 1: học sinh đã master hết → dừng
-        if chosen is None:
+        if target is None:
             logs.append({
                 "student_id": student_id,
                 "engine_type": engine_type,
@@ -248,9 +346,8 @@ def run_adaptive_simulation(
             })
             break
 
-        # case 2: select_adaptive_question trả về "RETRY"
-        # (string) → bỏ qua step này, không update ELO
-        if isinstance(chosen, str) and chosen == "RETRY":
+        # case 2: không có câu hỏi cho concept → bỏ qua step này, không update ELO
+        if isinstance(target, str):
             logs.append({
                 "student_id": student_id,
                 "engine_type": engine_type,
@@ -259,17 +356,17 @@ def run_adaptive_simulation(
             })
             continue
 
-        # từ đây trở xuống: chắc chắn chosen là 1 dòng của question_bank (pd.Series)
-        cid = chosen['concept_id']
-        qid = chosen['question_id']
-        q_elo = float(chosen['elo_difficulty'])
+        cid = nodes[target]
+        _, q_ids, q_elos, _ = core["questions"][target]
+        qid = q_ids[q_pos]
+        q_elo = float(q_elos[q_pos])
 
         # ELO trước khi làm câu này
-        s_elo_before = float(student_profiles.loc[student_id, f'elo_{cid}'])
+        s_elo_before = float(elos[target])
 
         # K-factor theo số câu đã làm trên concept
         k_factor = get_k_factor(
-            questions_answered=concept_counts.get(cid, 0),
+            questions_answered=int(concept_counts[target]),
             k_mode=k_mode,
             base_k=base_k,
         )
@@ -278,12 +375,12 @@ def run_adaptive_simulation(
         expected_p = 1 / (1 + 10 ** ((q_elo - s_elo_before) / 400))
 
         # simulate kết quả: correct = 1 / 0
-        correct = 1 if np.random.random() < expected_p else 0
+        correct = 1 if rng.random() < expected_p else 0
 
-        # update ELO
+        # update ELO (cập nhật vô hướng tại chỗ)
         s_elo_after = s_elo_before + k_factor * (correct - expected_p)
-        student_profiles.loc[student_id, f'elo_{cid}'] = s_elo_after
-        concept_counts[cid] = concept_counts.get(cid, 0) + 1
+        elos[target] = s_elo_after
+        concept_counts[target] += 1
 
         # thông tin chương & chuyển chương
         chapter = concept_to_chapter.get(cid, "Unknown")
@@ -313,9 +410,10 @@ def run_adaptive_simulation(
             "chapter_switch_flag": chapter_switch,
         })
 
-        # cập nhật tập ready_nodes cho lần sau
-        prev_ready_nodes = set(extra.get("ready_nodes", []))
+        # cập nhật tập ready cho lần sau
+        prev_ready = extra["ready_mask"]
 
+    store_student_elos(core, student_profiles, student_id, elos)
     return pd.DataFrame(logs), student_profiles
 
 """BLOCK 7 — Chạy mô phỏng cho tất cả học sinh (một engine)"""
@@ -328,7 +426,8 @@ def run_one_engine_all_students(
     k_mode,
     base_k,
     selection_strategy,
-    num_questions=500
+    num_questions=500,
+    seed=None
 ):
     profiles = student_profiles.copy()
     logs = []
@@ -342,7 +441,8 @@ def run_one_engine_all_students(
             base_k=base_k,
             selection_strategy=selection_strategy,
             cross_edges=cross_edges,
-            engine_type=engine_type
+            engine_type=engine_type,
+            seed=None if seed is None else derive_seed(seed, stu)
         )
         logs.append(log_df)
 
@@ -371,239 +471,264 @@ def summarize_experiment(log_df, engine_type, mastery_threshold, k_mode, base_k,
         })
     return res
 
-"""BLOCK 9 —  Tự động hóa phân tích độ nhạy (sensitivity grid)"""
-
-def run_sensitivity_grid():
-    mastery_thresholds = [1250, 1300, 1350]
-    k_modes = ["constant", "dynamic"]
-    base_ks = [16, 24, 32]
-    strategies = ["lowest_elo", "cross_chapter_unlock"]
-
-    all_res = []
-
-    for mt in mastery_thresholds:
-        for km in k_modes:
-            for bk in base_ks:
-                for strat in strategies:
-
-                    print(f"\n=== ADVANCED: mt={mt}, k={km}, base={bk}, strat={strat} ===")
-                    adv_log, _ = run_one_engine_all_students(
-                        "Advanced", concept_graph, CROSS_EDGES_ADV,
-                        mt, km, bk, strat
-                    )
-                    all_res.extend(
-                        summarize_experiment(adv_log, "Advanced", mt, km, bk, strat)
-                    )
-
-                    print(f"\n=== BASELINE: mt={mt}, k={km}, base={bk}, strat={strat} ===")
-                    base_log, _ = run_one_engine_all_students(
-                        "Baseline", concept_graph_baseline, CROSS_EDGES_BASE,
-                        mt, km, bk, strat
-                    )
-                    all_res.extend(
-                        summarize_experiment(base_log, "Baseline", mt, km, bk, strat)
-                    )
-
-    df = pd.DataFrame(all_res)
-    df.to_csv("sensitivity_summary.csv", index=False)
-    return df
-
-"""BLOCK 10 — Chạy toàn bộ phân tích độ nhạy"""
-
-sensitivity_df = run_sensitivity_grid()
-sensitivity_df.head()
-
-"""BLOCK 11 — Biểu đồ: So sánh Advanced vs Baseline (lowest_elo)
+"""BLOCK 9 —  Tự động hóa phân tích độ nhạy (sensitivity grid)
 
+Mỗi ô của lưới (engine × threshold × k_mode × base_k × strategy) là một tác vụ
+độc lập, chạy song song trên process pool. Seed của mỗi ô được suy ra từ chính
+các tham số của ô, nên kết quả giống hệt nhau giữa các lần chạy và với mọi số worker.
 """
 
-import pandas as pd
-import matplotlib.pyplot as plt
-
-df = pd.read_csv("sensitivity_summary.csv")
-
-subset = df[
-    (df['selection_reason'] == 'lowest_elo') &
-    (df['base_k'] == 16) &
-    (df['k_mode'] == 'constant') &
-    (df['mastery_threshold'] == 1250)
-]
-
-pivot = subset.pivot(index='student_id', columns='engine_type', values='chapter_switches')
-
-plt.figure(figsize=(10,6))
-pivot.plot(kind='bar')
-plt.title("Chapter Switches: Advanced vs Baseline (lowest_elo)")
-plt.xlabel("Student")
-plt.ylabel("Chapter Switches")
-plt.xticks(rotation=0)
-plt.grid(True)
-plt.tight_layout()
-plt.show()
-
-"""BLOCK 12 — Biểu đồ: So sánh chiến lược (lowest_elo vs cross_chapter_unlock)"""
-
-subset2 = df[
-    (df['engine_type'] == 'Advanced') &
-    (df['base_k'] == 16) &
-    (df['k_mode'] == 'constant') &
-    (df['mastery_threshold'] == 1250)
-]
-
-pivot2 = subset2.pivot(index='student_id', columns='selection_reason', values='chapter_switches')
-
-plt.figure(figsize=(10,6))
-pivot2.plot(kind='bar')
-plt.title("Strategy Impact: lowest_elo vs cross_chapter_unlock (Advanced)")
-plt.xlabel("Student")
-plt.ylabel("Chapter Switches")
-plt.xticks(rotation=0)
-plt.grid(True)
-plt.tight_layout()
-plt.show()
-
-"""BLOCK 13 — Biểu đồ: Ảnh hưởng của base_k lên số lần chuyển chương"""
-
-# === BLOCK 13A: Impact of base_k on Chapter Switches (k_mode = constant) ===
-
-subset3_const = df[
-    (df['engine_type'] == 'Advanced') &
-    (df['selection_reason'] == 'lowest_elo') &
-    (df['mastery_threshold'] == 1250) &
-    (df['k_mode'] == 'constant')
-].copy()
-
-plt.figure(figsize=(10,6))
-for stu in subset3_const['student_id'].unique():
-    d = subset3_const[subset3_const['student_id'] == stu].sort_values("base_k")
-    plt.plot(
-        d['base_k'],
-        d['chapter_switches'],
-        marker='o',
-        markersize=8,
-        linewidth=2,
-        label=stu
+ENGINES = {
+    "Advanced": (concept_graph, CROSS_EDGES_ADV),
+    "Baseline": (concept_graph_baseline, CROSS_EDGES_BASE),
+}
+
+def run_grid_cell(cell):
+    engine_type, mt, km, bk, strat, num_questions = cell
+    graph, cross_edges = ENGINES[engine_type]
+    print(f"\n=== {engine_type.upper()}: mt={mt}, k={km}, base={bk}, strat={strat} ===")
+    log, _ = run_one_engine_all_students(
+        engine_type, graph, cross_edges,
+        mt, km, bk, strat,
+        num_questions=num_questions,
+        seed=derive_seed(engine_type, mt, km, bk, strat, num_questions)
     )
+    return summarize_experiment(log, engine_type, mt, km, bk, strat)
+
+def run_sensitivity_grid(
+    mastery_thresholds=(1250, 1300, 1350),
+    k_modes=("constant", "dynamic"),
+    base_ks=(16, 24, 32),
+    strategies=("lowest_elo", "cross_chapter_unlock"),
+    engines=("Advanced", "Baseline"),
+    num_questions=500,
+    workers=None,
+    output_path="sensitivity_summary.csv",
+):
+    cells = [
+        (eng, mt, km, bk, strat, num_questions)
+        for mt in mastery_thresholds
+        for km in k_modes
+        for bk in base_ks
+        for strat in strategies
+        for eng in engines
+    ]
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if workers <= 1:
+        results = map(run_grid_cell, cells)
+        all_res = [r for res in results for r in res]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            # map giữ đúng thứ tự các ô như khi chạy tuần tự
+            results = ex.map(run_grid_cell, cells, chunksize=max(1, len(cells) // (workers * 4)))
+            all_res = [r for res in results for r in res]
 
-plt.title("Impact of base_k on Chapter Switches\n(Advanced, lowest_elo, threshold=1250, k_mode=constant)")
-plt.xlabel("base_k")
-plt.ylabel("chapter_switches")
-plt.xticks(sorted(subset3_const['base_k'].unique()))
-plt.grid(True, alpha=0.3)
-plt.legend()
-plt.tight_layout()
-plt.show()
-
-# === BLOCK 13B: Impact of base_k on Chapter Switches (k_mode = dynamic) ===
-
-subset3_dyn = df[
-    (df['engine_type'] == 'Advanced') &
-    (df['selection_reason'] == 'lowest_elo') &
-    (df['mastery_threshold'] == 1250) &
-    (df['k_mode'] == 'dynamic')
-].copy()
-
-plt.figure(figsize=(10,6))
-for stu in subset3_dyn['student_id'].unique():
-    d = subset3_dyn[subset3_dyn['student_id'] == stu].sort_values("base_k")
-    plt.plot(
-        d['base_k'],
-        d['chapter_switches'],
-        marker='o',
-        markersize=8,
-        linewidth=2,
-        label=stu
-    )
+    df = pd.DataFrame(all_res)
+    df.to_csv(output_path, index=False)
+    return df
 
-plt.title("Impact of base_k on Chapter Switches\n(Advanced, lowest_elo, threshold=1250, k_mode=dynamic)")
-plt.xlabel("base_k")
-plt.ylabel("chapter_switches")
-plt.xticks(sorted(subset3_dyn['base_k'].unique()))
-plt.grid(True, alpha=0.3)
-plt.legend()
-plt.tight_layout()
-plt.show()
-
-"""BLOCK 14 — Biểu đồ: Ảnh hưởng của mastery_threshold lên số lần chuyển chương"""
-
-# === BLOCK 14A: Impact of mastery_threshold on Chapter Switches (k_mode = constant) ===
-
-subset4_const = df[
-    (df['engine_type'] == 'Advanced') &
-    (df['selection_reason'] == 'lowest_elo') &
-    (df['base_k'] == 16) &
-    (df['k_mode'] == 'constant')
-].copy()
-
-plt.figure(figsize=(10,6))
-
-for stu in subset4_const['student_id'].unique():
-    d = subset4_const[subset4_const['student_id'] == stu].sort_values("mastery_threshold")
-    plt.plot(
-        d['mastery_threshold'],
-        d['chapter_switches'],
-        marker='o',
-        markersize=8,
-        linewidth=2,
-        label=stu
-    )
+# Các block dưới đây chỉ chạy khi thực thi trực tiếp, không chạy lại trong
+# các tiến trình worker của run_sensitivity_grid.
+if __name__ == "__main__":
+    """BLOCK 10 — Chạy toàn bộ phân tích độ nhạy"""
+
+    sensitivity_df = run_sensitivity_grid(workers=int(os.environ.get("SIM_WORKERS", 0)) or None)
+    sensitivity_df.head()
+
+    """BLOCK 11 — Biểu đồ: So sánh Advanced vs Baseline (lowest_elo)
+
+    """
+
+    import pandas as pd
+    import matplotlib.pyplot as plt
+
+    df = pd.read_csv("sensitivity_summary.csv")
+
+    subset = df[
+        (df['selection_reason'] == 'lowest_elo') &
+        (df['base_k'] == 16) &
+        (df['k_mode'] == 'constant') &
+        (df['mastery_threshold'] == 1250)
+    ]
+
+    pivot = subset.pivot(index='student_id', columns='engine_type', values='chapter_switches')
+
+    plt.figure(figsize=(10,6))
+    pivot.plot(kind='bar')
+    plt.title("Chapter Switches: Advanced vs Baseline (lowest_elo)")
+    plt.xlabel("Student")
+    plt.ylabel("Chapter Switches")
+    plt.xticks(rotation=0)
+    plt.grid(True)
+    plt.tight_layout()
+    plt.show()
+
+    """BLOCK 12 — Biểu đồ: So sánh chiến lược (lowest_elo vs cross_chapter_unlock)"""
+
+    subset2 = df[
+        (df['engine_type'] == 'Advanced') &
+        (df['base_k'] == 16) &
+        (df['k_mode'] == 'constant') &
+        (df['mastery_threshold'] == 1250)
+    ]
+
+    pivot2 = subset2.pivot(index='student_id', columns='selection_reason', values='chapter_switches')
+
+    plt.figure(figsize=(10,6))
+    pivot2.plot(kind='bar')
+    plt.title("Strategy Impact: lowest_elo vs cross_chapter_unlock (Advanced)")
+    plt.xlabel("Student")
+    plt.ylabel("Chapter Switches")
+    plt.xticks(rotation=0)
+    plt.grid(True)
+    plt.tight_layout()
+    plt.show()
+
+    """BLOCK 13 — Biểu đồ: Ảnh hưởng của base_k lên số lần chuyển chương"""
+
+    # === BLOCK 13A: Impact of base_k on Chapter Switches (k_mode = constant) ===
+
+    subset3_const = df[
+        (df['engine_type'] == 'Advanced') &
+        (df['selection_reason'] == 'lowest_elo') &
+        (df['mastery_threshold'] == 1250) &
+        (df['k_mode'] == 'constant')
+    ].copy()
+
+    plt.figure(figsize=(10,6))
+    for stu in subset3_const['student_id'].unique():
+        d = subset3_const[subset3_const['student_id'] == stu].sort_values("base_k")
+        plt.plot(
+            d['base_k'],
+            d['chapter_switches'],
+            marker='o',
+            markersize=8,
+            linewidth=2,
+            label=stu
+        )
 
-plt.title("Impact of mastery_threshold on Chapter Switches\n(Advanced, lowest_elo, base_k=16, k_mode=constant)")
-plt.xlabel("mastery_threshold")
-plt.ylabel("chapter_switches")
-plt.xticks(sorted(subset4_const['mastery_threshold'].unique()))
-plt.grid(True, alpha=0.3)
-plt.legend()
-plt.tight_layout()
-plt.show()
-
-# === BLOCK 14B: Impact of mastery_threshold on Chapter Switches (k_mode = dynamic) ===
-
-subset4_dyn = df[
-    (df['engine_type'] == 'Advanced') &
-    (df['selection_reason'] == 'lowest_elo') &
-    (df['base_k'] == 16) &
-    (df['k_mode'] == 'dynamic')
-].copy()
-
-plt.figure(figsize=(10,6))
-
-for stu in subset4_dyn['student_id'].unique():
-    d = subset4_dyn[subset4_dyn['student_id'] == stu].sort_values("mastery_threshold")
-    plt.plot(
-        d['mastery_threshold'],
-        d['chapter_switches'],
-        marker='o',
-        markersize=8,
-        linewidth=2,
-        label=stu
-    )
+    plt.title("Impact of base_k on Chapter Switches\n(Advanced, lowest_elo, threshold=1250, k_mode=constant)")
+    plt.xlabel("base_k")
+    plt.ylabel("chapter_switches")
+    plt.xticks(sorted(subset3_const['base_k'].unique()))
+    plt.grid(True, alpha=0.3)
+    plt.legend()
+    plt.tight_layout()
+    plt.show()
+
+    # === BLOCK 13B: Impact of base_k on Chapter Switches (k_mode = dynamic) ===
+
+    subset3_dyn = df[
+        (df['engine_type'] == 'Advanced') &
+        (df['selection_reason'] == 'lowest_elo') &
+        (df['mastery_threshold'] == 1250) &
+        (df['k_mode'] == 'dynamic')
+    ].copy()
+
+    plt.figure(figsize=(10,6))
+    for stu in subset3_dyn['student_id'].unique():
+        d = subset3_dyn[subset3_dyn['student_id'] == stu].sort_values("base_k")
+        plt.plot(
+            d['base_k'],
+            d['chapter_switches'],
+            marker='o',
+            markersize=8,
+            linewidth=2,
+            label=stu
+        )
+
+    plt.title("Impact of base_k on Chapter Switches\n(Advanced, lowest_elo, threshold=1250, k_mode=dynamic)")
+    plt.xlabel("base_k")
+    plt.ylabel("chapter_switches")
+    plt.xticks(sorted(subset3_dyn['base_k'].unique()))
+    plt.grid(True, alpha=0.3)
+    plt.legend()
+    plt.tight_layout()
+    plt.show()
+
+    """BLOCK 14 — Biểu đồ: Ảnh hưởng của mastery_threshold lên số lần chuyển chương"""
+
+    # === BLOCK 14A: Impact of mastery_threshold on Chapter Switches (k_mode = constant) ===
+
+    subset4_const = df[
+        (df['engine_type'] == 'Advanced') &
+        (df['selection_reason'] == 'lowest_elo') &
+        (df['base_k'] == 16) &
+        (df['k_mode'] == 'constant')
+    ].copy()
+
+    plt.figure(figsize=(10,6))
+
+    for stu in subset4_const['student_id'].unique():
+        d = subset4_const[subset4_const['student_id'] == stu].sort_values("mastery_threshold")
+        plt.plot(
+            d['mastery_threshold'],
+            d['chapter_switches'],
+            marker='o',
+            markersize=8,
+            linewidth=2,
+            label=stu
+        )
+
+    plt.title("Impact of mastery_threshold on Chapter Switches\n(Advanced, lowest_elo, base_k=16, k_mode=constant)")
+    plt.xlabel("mastery_threshold")
+    plt.ylabel("chapter_switches")
+    plt.xticks(sorted(subset4_const['mastery_threshold'].unique()))
+    plt.grid(True, alpha=0.3)
+    plt.legend()
+    plt.tight_layout()
+    plt.show()
+
+    # === BLOCK 14B: Impact of mastery_threshold on Chapter Switches (k_mode = dynamic) ===
+
+    subset4_dyn = df[
+        (df['engine_type'] == 'Advanced') &
+        (df['selection_reason'] == 'lowest_elo') &
+        (df['base_k'] == 16) &
+        (df['k_mode'] == 'dynamic')
+    ].copy()
+
+    plt.figure(figsize=(10,6))
+
+    for stu in subset4_dyn['student_id'].unique():
+        d = subset4_dyn[subset4_dyn['student_id'] == stu].sort_values("mastery_threshold")
+        plt.plot(
+            d['mastery_threshold'],
+            d['chapter_switches'],
+            marker='o',
+            markersize=8,
+            linewidth=2,
+            label=stu
+        )
 
-plt.title("Impact of mastery_threshold on Chapter Switches\n(Advanced, lowest_elo, base_k=16, k_mode=dynamic)")
-plt.xlabel("mastery_threshold")
-plt.ylabel("chapter_switches")
-plt.xticks(sorted(subset4_dyn['mastery_threshold'].unique()))
-plt.grid(True, alpha=0.3)
-plt.legend()
-plt.tight_layout()
-plt.show()
+    plt.title("Impact of mastery_threshold on Chapter Switches\n(Advanced, lowest_elo, base_k=16, k_mode=dynamic)")
+    plt.xlabel("mastery_threshold")
+    plt.ylabel("chapter_switches")
+    plt.xticks(sorted(subset4_dyn['mastery_threshold'].unique()))
+    plt.grid(True, alpha=0.3)
+    plt.legend()
+    plt.tight_layout()
+    plt.show()
 
-"""BLOCK 15 — Biểu đồ: Phân phối kích thước tập ready theo chiến lược"""
+    """BLOCK 15 — Biểu đồ: Phân phối kích thước tập ready theo chiến lược"""
 
-data_low = df[df['selection_reason']=='lowest_elo']['avg_ready_size']
-data_unlock = df[df['selection_reason']=='cross_chapter_unlock']['avg_ready_size']
+    data_low = df[df['selection_reason']=='lowest_elo']['avg_ready_size']
+    data_unlock = df[df['selection_reason']=='cross_chapter_unlock']['avg_ready_size']
 
-plt.figure(figsize=(10,6))
+    plt.figure(figsize=(10,6))
 
-plt.boxplot([data_low, data_unlock],
-            tick_labels=['lowest_elo', 'cross_chapter_unlock'])
+    plt.boxplot([data_low, data_unlock],
+                tick_labels=['lowest_elo', 'cross_chapter_unlock'])
 
-# add scatter to show actual points
-plt.scatter([1]*len(data_low), data_low, color='red', alpha=0.6)
-plt.scatter([2]*len(data_unlock), data_unlock, color='blue', alpha=0.6)
+    # add scatter to show actual points
+    plt.scatter([1]*len(data_low), data_low, color='red', alpha=0.6)
+    plt.scatter([2]*len(data_unlock), data_unlock, color='blue', alpha=0.6)
 
-plt.title("Ready Set Size Distribution by Strategy")
-plt.ylabel("avg_ready_size")
-plt.grid(True)
-plt.tight_layout()
-plt.show()
\ No newline at end of file
+    plt.title("Ready Set Size Distribution by Strategy")
+    plt.ylabel("avg_ready_size")
+    plt.grid(True)
+    plt.tight_layout()
+    plt.show()
\ No newline at end of file
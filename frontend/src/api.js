@@ -28,17 +28,60 @@ export const submitAnswer = async (studentId, questionId, isCorrect) => {
   return response.data;
 };
 
-export const getStudentProgress = async (studentId) => {
-  const response = await api.get(`/student-progress/${studentId}`);
+export const submitAndNext = async (studentId, questionId, isCorrect) => {
+  const response = await api.post("/submit-and-next", {
+    student_id: studentId,
+    question_id: questionId,
+    is_correct: isCorrect,
+  });
   return response.data;
 };
 
+// Last full progress per student; later calls ask only for what changed
+// since its version and merge the delta into it.
+const progressSnapshots = {};
+const DELTA_KEYS = { concepts: "id", chapters: "id", progress_details: "concept_id" };
+
+const applyProgressDelta = (base, delta) => {
+  const merged = { ...base };
+  Object.entries(delta).forEach(([field, value]) => {
+    if (field === "mode" || field === "since_version") return;
+    const key = DELTA_KEYS[field];
+    if (key) {
+      const changed = new Map(value.map((item) => [item[key], item]));
+      merged[field] = base[field].map((item) => changed.get(item[key]) ?? item);
+    } else {
+      merged[field] = value;
+    }
+  });
+  return merged;
+};
+
+export const getStudentProgress = async (studentId) => {
+  const snapshot = progressSnapshots[studentId];
+  const params = snapshot ? { since_version: snapshot.version } : {};
+  const response = await api.get(`/student-progress/${studentId}`, { params });
+  const data = response.data;
+  const progress =
+    data.mode === "delta" && snapshot ? applyProgressDelta(snapshot, data) : data;
+  delete progress.mode;
+  progressSnapshots[studentId] = progress;
+  return progress;
+};
+
 export const getStudents = async () => {
   const response = await api.get("/students");
   return response.data;
 };
 
-export const getStudentAnalytics = async (studentId) => {
-  const response = await api.get(`/analytics/${studentId}`);
+export const getClassOverview = async (role = "student") => {
+  const response = await api.get("/class-overview", { params: { role } });
+  return response.data;
+};
+
+// params: { max_points } for a downsampled trajectory,
+// { limit, after, after_id } for keyset pages (spread next_cursor into params)
+export const getStudentAnalytics = async (studentId, params = {}) => {
+  const response = await api.get(`/analytics/${studentId}`, { params });
   return response.data;
 };
@@ -1,6 +1,6 @@
 import { useEffect, useState } from "react";
 import { useNavigate } from "react-router-dom";
-import { getNextQuestion, submitAnswer, getStudentProgress } from "../api";
+import { getNextQuestion, submitAndNext, getStudentProgress } from "../api";
 import LoadingSpinner from "../components/LoadingSpinner";
 import ProgressSidebar from "../components/ProgressSidebar";
 
@@ -13,6 +13,8 @@ export default function Learning() {
   const [error, setError] = useState(null);
   const [progress, setProgress] = useState(null);
   const [selectedOption, setSelectedOption] = useState(null);
+  // Next question returned together with the last submit
+  const [nextResult, setNextResult] = useState(null);
 
   const studentId = localStorage.getItem("studentId");
 
@@ -50,7 +52,8 @@ export default function Learning() {
     setError(null);
 
     try {
-      const res = await getNextQuestion(studentId);
+      const res = nextResult || (await getNextQuestion(studentId));
+      setNextResult(null);
       if (res.status === "error") {
         setError(res.message);
       } else if (res.status === "all_mastered") {
@@ -76,11 +79,12 @@ export default function Learning() {
     const isCorrect = option.text === "Correct Answer";
 
     try {
-      const res = await submitAnswer(
+      const { submit: res, next } = await submitAndNext(
         studentId,
         question.question_id,
         isCorrect
       );
+      setNextResult(next);
       setFeedback({
         isCorrect,
         oldElo: res.old_elo,
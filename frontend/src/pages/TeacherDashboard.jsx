@@ -1,5 +1,5 @@
 import React, { useEffect, useState } from "react";
-import { getStudents, getStudentAnalytics } from "../api";
+import { getClassOverview, getStudentAnalytics } from "../api";
 import { useNavigate } from "react-router-dom";
 import { ArrowLeft, User, BarChart2 } from "lucide-react";
 import {
@@ -14,6 +14,9 @@ import {
   ReferenceLine,
 } from "recharts";
 
+// Trajectory is downsampled server-side to at most this many points
+const MAX_CHART_POINTS = 300;
+
 export default function TeacherDashboard() {
   const navigate = useNavigate();
   const [students, setStudents] = useState([]);
@@ -28,8 +31,8 @@ export default function TeacherDashboard() {
 
   const fetchStudents = async () => {
     try {
-      const data = await getStudents();
-      setStudents(data);
+      const data = await getClassOverview();
+      setStudents(data.students);
     } catch (err) {
       console.error("Failed to fetch students", err);
     }
@@ -38,7 +41,9 @@ export default function TeacherDashboard() {
   const handleFetchAnalytics = async (student) => {
     setLoading(true);
     try {
-      const data = await getStudentAnalytics(student.id);
+      const data = await getStudentAnalytics(student.id, {
+        max_points: MAX_CHART_POINTS,
+      });
       setAnalytics(data);
       setSelectedStudent(student.id);
       setSelectedStudentName(student.full_name);
@@ -56,7 +61,7 @@ export default function TeacherDashboard() {
 
     const accumulatedData = analytics.logs.map((log, index) => {
       return {
-        step: index + 1,
+        step: log.step ?? index + 1,
         questionDiff: log.difficulty_elo || 1000,
         studentElo: log.new_elo,
         concept: log.concept_id,
@@ -66,8 +71,9 @@ export default function TeacherDashboard() {
       };
     });
 
-    const uniqueConcepts = new Set(analytics.logs.map((l) => l.concept_id))
-      .size;
+    const uniqueConcepts = analytics.summary
+      ? analytics.summary.unique_concepts
+      : new Set(analytics.logs.map((l) => l.concept_id)).size;
 
     const finalElo =
       accumulatedData.length > 0
@@ -76,7 +82,9 @@ export default function TeacherDashboard() {
 
     const initialElo =
       analytics.logs.length > 0 ? analytics.logs[0].old_elo : 1000;
-    const totalSteps = accumulatedData.length;
+    const totalSteps = analytics.summary
+      ? analytics.summary.total_steps
+      : accumulatedData.length;
     const totalGrowth = finalElo - initialElo;
 
     return {
@@ -218,6 +226,21 @@ export default function TeacherDashboard() {
               <div style={{ fontSize: "0.75rem", opacity: 0.8 }}>
                 ID: {s.id.slice(0, 8)}...
               </div>
+              <div style={{ fontSize: "0.75rem", opacity: 0.8 }}>
+                Avg ELO: {s.average_elo} · Mastered: {s.mastered_concepts}/
+                {s.total_concepts}
+              </div>
+              {s.remediation_flags.length > 0 && (
+                <div
+                  style={{
+                    fontSize: "0.75rem",
+                    marginTop: "0.25rem",
+                    color: "#fde68a",
+                  }}
+                >
+                  ⚠ {s.remediation_flags.join(", ")}
+                </div>
+              )}
             </button>
           ))}
         </div>